@@ -1,8 +1,15 @@
 """ LOCAL IMPORTS """
 from .key import Key
-from .model import Model
+from .model import Model, DuplicateKindError, EntityNotFoundError, get_kind, get_kinds
 from .properties import *
 from .query import *
+from .aggregation import Count, Sum, Avg, Min, Max
+from .connection import configure
+from .context import Context, ContextMiddleware
+from .cache import cache_stats, query_cache_stats, clear_caches
+from .indexes import Index, ensure_indexes
+from .advisor import IndexAdvisorWarning, enable_index_advisor
+from .hooks import add_pre_hook, add_post_hook, remove_hook
 
 def start_development_server(port=8000, debug=False, threading=True):
   """
@@ -0,0 +1,161 @@
+""" GLOBAL IMPORTS """
+import warnings
+
+
+""" MONGO IMPORTS """
+import pymongo
+
+
+class IndexAdvisorWarning(UserWarning):
+  pass
+
+
+# the advisor explains every query before it runs, which costs an
+# extra round trip. Hence it is disabled unless explicitly enabled,
+# typically in development or in a test suite.
+_enabled = False
+
+# the (kind, suggested keys) pairs already warned about
+_warned = set()
+
+EQUALITY_OPERATORS = ('$eq', '$in', '$all')
+
+
+def enable_index_advisor(enabled=True):
+  """
+  ' PURPOSE
+  '   Turns the development mode index advisor on or off. While on,
+  '   every query is explained before it runs and an
+  '   IndexAdvisorWarning, with a suggested index, is issued whenever
+  '   the winning plan scans the whole collection or sorts in memory.
+  ' PARAMETERS
+  '   optional <bool enabled>
+  ' RETURNS
+  '   Nothing
+  ' NOTES
+  '   1. To fail a test suite on missing indexes turn the warning into
+  '      an error: warnings.simplefilter('error', db.IndexAdvisorWarning)
+  """
+  global _enabled
+  _enabled = enabled
+  _warned.clear()
+
+
+def is_enabled():
+  return _enabled
+
+
+def summarize(explained):
+  """
+  ' PURPOSE
+  '   Condenses the output of an explain command.
+  ' PARAMETERS
+  '   <dict explained> the raw explain output
+  ' RETURNS
+  '   <dict summary> with the keys
+  '     winning_plan ~ the winning plan's stage tree
+  '     used_index ~ whether an index was scanned
+  '     indexes ~ the names of the scanned indexes
+  '     collection_scan ~ whether the whole collection was scanned
+  '     in_memory_sort ~ whether results were sorted in memory
+  '     docs_examined, keys_examined, returned ~ execution statistics
+  '                                              (None if unavailable)
+  """
+  plan = explained.get('queryPlanner', {}).get('winningPlan', {})
+  # slot based execution engine plans nest the classic plan
+  plan = plan.get('queryPlan', plan)
+
+  stages = []
+  pending = [plan]
+  while pending:
+    stage = pending.pop()
+    stages.append(stage)
+    if 'inputStage' in stage:
+      pending.append(stage['inputStage'])
+    pending.extend(stage.get('inputStages', []))
+
+  names = [stage.get('stage') for stage in stages]
+  stats = explained.get('executionStats', {})
+
+  return {
+    'winning_plan': plan,
+    'used_index': 'IXSCAN' in names or 'IDHACK' in names or 'EXPRESS_IXSCAN' in names,
+    'indexes': [stage['indexName'] for stage in stages if 'indexName' in stage],
+    'collection_scan': 'COLLSCAN' in names,
+    'in_memory_sort': 'SORT' in names,
+    'docs_examined': stats.get('totalDocsExamined'),
+    'keys_examined': stats.get('totalKeysExamined'),
+    'returned': stats.get('nReturned')
+  }
+
+
+def suggest_index(bson, sort):
+  """
+  ' PURPOSE
+  '   Suggests an index for a filter and sort following the
+  '   equality, sort, range rule: equality matched fields first, then
+  '   the sorted fields, then fields matched by a range.
+  ' PARAMETERS
+  '   <dict bson> a compiled filter
+  '   <list tuple(str name, int direction) sort>
+  ' RETURNS
+  '   <list tuple(str name, int direction) keys>
+  ' NOTES
+  '   1. Fields only matched within an $or are left out since they
+  '      cannot use a single compound index.
+  """
+  equality, ranges = [], []
+  pending = [bson]
+  while pending:
+    clause = pending.pop(0)
+    for field, condition in clause.items():
+      if field == '$and':
+        pending.extend(condition)
+      elif field.startswith('$'):
+        continue
+      elif isinstance(condition, dict) and any(op.startswith('$') for op in condition):
+        if any(op in EQUALITY_OPERATORS for op in condition):
+          equality.append(field)
+        else:
+          ranges.append(field)
+      else:
+        equality.append(field)
+
+  keys, seen = [], set()
+  for field, direction in ([(field, pymongo.ASCENDING) for field in equality] +
+                           list(sort) +
+                           [(field, pymongo.ASCENDING) for field in ranges]):
+    if not field in seen:
+      seen.add(field)
+      keys.append((field, direction))
+  return keys
+
+
+def check(model, bson, sort, cursor):
+  """
+  ' PURPOSE
+  '   Explains the given cursor and warns if it runs as a collection
+  '   scan or sorts in memory. Called by queries while the advisor is
+  '   enabled.
+  ' PARAMETERS
+  '   <class MyModel extends Model model>
+  '   <dict bson> the compiled filter
+  '   <list tuple(str name, int direction) sort>
+  '   <Cursor cursor> an unconsumed pymongo cursor
+  ' RETURNS
+  '   <dict summary> see summarize
+  """
+  summary = summarize(cursor.explain())
+  if not summary['collection_scan'] and not summary['in_memory_sort']:
+    return summary
+
+  keys = suggest_index(bson, sort)
+  if not keys or (model.__name__, tuple(keys)) in _warned:
+    return summary
+  _warned.add((model.__name__, tuple(keys)))
+
+  problem = 'a collection scan' if summary['collection_scan'] else 'an in-memory sort'
+  warnings.warn('%s query %s ran as %s (examined %s documents to return %s). Consider an index on %s' % (
+    model.__name__, bson, problem, summary['docs_examined'], summary['returned'], keys
+  ), IndexAdvisorWarning, stacklevel=4)
+  return summary
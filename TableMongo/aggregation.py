@@ -0,0 +1,324 @@
+""" LOCAL IMPORTS """
+from .properties import Property, SortDescriptor
+from . import hooks
+
+
+""" MONGO IMPORTS """
+import pymongo
+
+
+# the column holding the single accumulator of Grouping.count, sum,
+# ... A class attribute named __value is name mangled, so no property
+# can clash with it.
+_VALUE = '__value'
+
+
+class Accumulator(object):
+  """
+  ' PURPOSE
+  '   Computes one value over every entity of a group, on the server.
+  '   See Count, Sum, Avg, Min and Max.
+  """
+
+  OPERATOR = None
+
+  def __init__(self, prop):
+    """
+    ' PURPOSE
+    '   Initializes the accumulator over the given property.
+    ' PARAMETERS
+    '   <Property prop>
+    ' RETURNS
+    '   <Accumulator accumulator>
+    """
+    if not isinstance(prop, Property):
+      raise ValueError('Expected a property. Instead got: %s' % prop)
+    if prop.is_multiple():
+      raise ValueError('Cannot accumulate the multiple property %s' % prop)
+    self.property = prop
+
+  def _check(self, model):
+    if not self.property.name() in model.properties():
+      raise ValueError('Expected a property of %s. Instead got: %s' % (model.__name__, self.property))
+
+  def stage(self):
+    """
+    ' PURPOSE
+    '   Returns the accumulator expression of the $group stage.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <dict expression>
+    """
+    return { self.OPERATOR: '$%s' % self.property.name() }
+
+  def unpack(self, value):
+    return value
+
+  def __repr__(self):
+    """
+    ' see self.__str__
+    """
+    return self.__str__()
+
+  def __str__(self):
+    return '%s(%s)' % (self.__class__.__name__, self.property)
+
+
+class Count(Accumulator):
+  """
+  ' PURPOSE
+  '   The amount of entities in the group.
+  ' EXAMPLE USAGE
+  '   -> Trip.query().group_by(Trip.author).aggregate(trips=db.Count())
+  """
+
+  def __init__(self):
+    self.property = None
+
+  def _check(self, model):
+    pass
+
+  def stage(self):
+    return { '$sum': 1 }
+
+  def __str__(self):
+    return 'Count()'
+
+
+class Sum(Accumulator):
+  """
+  ' PURPOSE
+  '   The total of a numeric property. Entities without a value are
+  '   ignored.
+  """
+
+  OPERATOR = '$sum'
+
+
+class Avg(Accumulator):
+  """
+  ' PURPOSE
+  '   The mean of a numeric property. Entities without a value are
+  '   ignored, None if no entity has one.
+  """
+
+  OPERATOR = '$avg'
+
+
+class Min(Accumulator):
+  """
+  ' PURPOSE
+  '   The smallest value of a property, unpacked by the property.
+  """
+
+  OPERATOR = '$min'
+
+  def unpack(self, value):
+    return None if value is None else self.property.unpack(value)
+
+
+class Max(Accumulator):
+  """
+  ' PURPOSE
+  '   The largest value of a property, unpacked by the property.
+  """
+
+  OPERATOR = '$max'
+
+  def unpack(self, value):
+    return None if value is None else self.property.unpack(value)
+
+
+class Grouping(object):
+  """
+  ' PURPOSE
+  '   Groups the entities matched by a query by the values of some of
+  '   their properties and computes accumulators per group, all within
+  '   a single aggregation pipeline. Only one row per group is sent
+  '   back rather than every matched entity.
+  '
+  ' EXAMPLE USAGE
+  '   -> Trip.query().group_by(Trip.author).count()
+  '   -> {ModelReference(Key('User', '...')): 12, ...}
+  '
+  '   -> Trip.query(Trip.distance > 0).group_by(Trip.author).aggregate(
+  '   ->   trips=db.Count(), total=db.Sum(Trip.distance), order='-total', limit=10)
+  '   -> [{'author': ModelReference(...), 'trips': 12, 'total': 310.5}, ...]
+  '
+  ' NOTES
+  '   1. Grouping by a multiple property groups by each of its values
+  '      (the property is unwound), ex. the amount of entities per tag.
+  '   2. Entities without a value are grouped under None (or the
+  '      property's default).
+  """
+
+  def __init__(self, query, props):
+    """
+    ' PURPOSE
+    '   Initializes the grouping. see Query.group_by
+    ' PARAMETERS
+    '   <Query query>
+    '   <list Property props> may be empty to aggregate every entity
+    '                         into one group
+    ' RETURNS
+    '   <Grouping grouping>
+    """
+    model = query._model
+    for prop in props:
+      if not isinstance(prop, Property) or not prop.name() in model.properties():
+        raise ValueError('Expected a property of %s. Instead got: %s' % (model.__name__, prop))
+    self._query = query
+    self._props = tuple(props)
+
+  def _sort(self, order, accumulators):
+    """
+    ' PURPOSE
+    '   Compiles the order of the groups into a $sort stage.
+    ' PARAMETERS
+    '   <list str|Property|SortDescriptor order> accumulator or grouped
+    '                                            property names, '-name'
+    '                                            for descending
+    '   <dict accumulators>
+    ' RETURNS
+    '   <dict sort>
+    """
+    grouped = [prop.name() for prop in self._props]
+    sort = {}
+    for descriptor in order:
+      if isinstance(descriptor, Property):
+        descriptor = +descriptor
+      if isinstance(descriptor, SortDescriptor):
+        descending = descriptor.direction == SortDescriptor.DESCENDING
+        name = descriptor.property.name()
+      else:
+        descending = descriptor.startswith('-')
+        name = descriptor.lstrip('-+')
+      direction = pymongo.DESCENDING if descending else pymongo.ASCENDING
+
+      if name in accumulators:
+        sort[name] = direction
+      elif name in grouped:
+        sort['_id.%s' % name] = direction
+      else:
+        raise ValueError('Can only order by an accumulator or grouped property. Instead got: %s' % name)
+    return sort
+
+  def pipeline(self, order=None, limit=None, **accumulators):
+    """
+    ' PURPOSE
+    '   Compiles the aggregation pipeline: $match (this query's filter),
+    '   $unwind (multiple grouped properties), $group, $sort and $limit.
+    ' PARAMETERS
+    '   see self.aggregate
+    ' RETURNS
+    '   <list dict stages>
+    """
+    model = self._query._model
+    if not accumulators:
+      raise ValueError('Expected at least one accumulator')
+    for name, accumulator in accumulators.items():
+      if not isinstance(accumulator, Accumulator):
+        raise ValueError('Expected an accumulator for %s. Instead got: %s' % (name, accumulator))
+      if name == '_id' or name in [prop.name() for prop in self._props]:
+        raise ValueError('Accumulator name %s clashes with a grouped property' % name)
+      accumulator._check(model)
+
+    stages = []
+    bson = self._query._filter()
+    if bson:
+      stages.append({ '$match': bson })
+    for prop in self._props:
+      if prop.is_multiple():
+        stages.append({ '$unwind': { 'path': '$%s' % prop.name(), 'preserveNullAndEmptyArrays': True } })
+
+    group = { '_id': dict((prop.name(), '$%s' % prop.name()) for prop in self._props) or None }
+    for name, accumulator in accumulators.items():
+      group[name] = accumulator.stage()
+    stages.append({ '$group': group })
+
+    if order:
+      if isinstance(order, (str, Property, SortDescriptor)):
+        order = [order]
+      stages.append({ '$sort': self._sort(order, accumulators) })
+    if limit:
+      stages.append({ '$limit': limit })
+    return stages
+
+  def aggregate(self, order=None, limit=None, **accumulators):
+    """
+    ' PURPOSE
+    '   Runs the aggregation and returns one row per group.
+    ' PARAMETERS
+    '   optional <list order> see self._sort. Groups are unordered by
+    '                         default
+    '   optional <int limit> the max amount of groups returned
+    '   **accumulators <Accumulator> keyed by the name of their column
+    ' RETURNS
+    '   <list dict rows> each holding the grouped properties' values
+    '                    and the accumulated values by name
+    """
+    model = self._query._model
+    stages = self.pipeline(order, limit, **accumulators)
+
+    event = hooks.start('aggregate', model, self._query._filter())
+    documents = list(model._collection().aggregate(stages))
+    if event: hooks.finish(event, documents=len(documents))
+
+    rows = []
+    for document in documents:
+      row = {}
+      grouped = document['_id'] or {}
+      for prop in self._props:
+        value = grouped.get(prop.name())
+        if prop.is_multiple():
+          # unwound, hence a single value
+          row[prop.name()] = None if value is None else prop.unpack(value)
+        else:
+          row[prop.name()] = prop._unpack(value)
+      for name, accumulator in accumulators.items():
+        row[name] = accumulator.unpack(document.get(name))
+      rows.append(row)
+    return rows
+
+  def _per_group(self, accumulator):
+    """
+    ' PURPOSE
+    '   Runs a single accumulator and maps each group to its value.
+    ' PARAMETERS
+    '   <Accumulator accumulator>
+    ' RETURNS
+    '   <dict results> keyed by the grouped value, or by a tuple of
+    '                  the grouped values when grouping by many
+    '                  properties
+    """
+    names = [prop.name() for prop in self._props]
+    results = {}
+    for row in self.aggregate(**{ _VALUE: accumulator }):
+      group = tuple(row[name] for name in names)
+      results[group[0] if len(group) == 1 else group] = row[_VALUE]
+    return results
+
+  def count(self):
+    return self._per_group(Count())
+
+  def sum(self, prop):
+    return self._per_group(Sum(prop))
+
+  def avg(self, prop):
+    return self._per_group(Avg(prop))
+
+  def min(self, prop):
+    return self._per_group(Min(prop))
+
+  def max(self, prop):
+    return self._per_group(Max(prop))
+
+  def __repr__(self):
+    """
+    ' see self.__str__
+    """
+    return self.__str__()
+
+  def __str__(self):
+    return 'Grouping(%s, by=%s)' % (self._query, list(self._props))
@@ -0,0 +1,292 @@
+""" GLOBAL IMPORTS """
+import threading
+import time
+from collections import OrderedDict
+
+
+""" MONGO IMPORTS """
+import bson as bsonlib
+
+
+class LRUCache(object):
+  """
+  ' PURPOSE
+  '   A thread-safe, size bounded cache that evicts the least recently
+  '   used entry and optionally expires entries after a ttl. Used by
+  '   the process-wide entity cache to hold packed documents.
+  """
+
+  def __init__(self, max_size=1000, ttl=None):
+    """
+    ' PURPOSE
+    '   Initializes an empty cache.
+    ' PARAMETERS
+    '   optional <int max_size> the max amount of entries held
+    '   optional <float ttl> seconds before an entry expires, None
+    '                        means entries never expire
+    ' RETURNS
+    '   <LRUCache cache>
+    """
+    self.max_size = max_size
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    """
+    ' PURPOSE
+    '   Returns the value held for the given key.
+    ' PARAMETERS
+    '   <object key>
+    ' RETURNS
+    '   <object value> or None if missing or expired
+    """
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None or (entry[0] and entry[0] < time.time()):
+        if entry is not None:
+          del self._entries[key]
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[1]
+
+  def set(self, key, value, ttl=None):
+    """
+    ' PURPOSE
+    '   Holds the given value, evicting the least recently used entry
+    '   when the cache is full.
+    ' PARAMETERS
+    '   <object key>
+    '   <object value>
+    '   optional <float ttl> overrides the cache's ttl for this entry
+    ' RETURNS
+    '   Nothing
+    """
+    ttl = ttl or self.ttl
+    expires = time.time() + ttl if ttl else None
+    with self._lock:
+      self._entries[key] = (expires, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+
+  def evict(self, key):
+    """
+    ' PURPOSE
+    '   Forgets the value held for the given key if there is one.
+    ' PARAMETERS
+    '   <object key>
+    ' RETURNS
+    '   Nothing
+    """
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def clear(self):
+    """
+    ' PURPOSE
+    '   Forgets every entry.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   Nothing
+    """
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self):
+    """
+    ' PURPOSE
+    '   Reports the usage of this cache.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <dict stats> hits, misses, evictions and size
+    """
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'size': len(self._entries)
+    }
+
+
+class DocumentCache(LRUCache):
+  """
+  ' PURPOSE
+  '   An LRUCache of documents, or lists of documents, held as encoded
+  '   BSON. Every get decodes fresh documents, so entities built from
+  '   them never share mutable values (ex. lists and dicts) with the
+  '   cache or with each other and an unsaved in place change cannot
+  '   leak into later gets.
+  """
+
+  def get(self, key):
+    raw = super(DocumentCache, self).get(key)
+    if raw is None:
+      return None
+    if isinstance(raw, tuple):
+      return [bsonlib.decode(item) for item in raw]
+    return bsonlib.decode(raw)
+
+  def set(self, key, value, ttl=None):
+    if isinstance(value, list):
+      raw = tuple(bsonlib.encode(document) for document in value)
+    else:
+      raw = bsonlib.encode(value)
+    super(DocumentCache, self).set(key, raw, ttl)
+
+
+""" ENTITY CACHE """
+# one cache of packed documents (keyed by id) per model that opted in
+# via its _global_cache class attribute.
+_caches = {}
+_lock = threading.Lock()
+
+
+def get_cache(model):
+  """
+  ' PURPOSE
+  '   Returns the process-wide document cache of the given model,
+  '   creating it on first use.
+  ' PARAMETERS
+  '   <class MyModel extends Model model>
+  ' RETURNS
+  '   <DocumentCache cache> or None if the model does not use the cache
+  """
+  if not model._global_cache:
+    return None
+  cache = _caches.get(model)
+  if cache is None:
+    with _lock:
+      cache = _caches.get(model)
+      if cache is None:
+        cache = _caches[model] = DocumentCache(model._global_cache_size, model._global_cache_ttl)
+  return cache
+
+
+""" QUERY RESULT CACHE """
+# one cache of query results per model that opted in via its
+# _query_cache class attribute, along with a generation counter per
+# model bumped after every write to it. Results are cached under the
+# generation current when their query was sent, so once a kind is
+# written to its earlier results are never served again and simply age
+# out of the cache.
+_query_caches = {}
+_generations = {}
+
+
+def get_query_cache(model):
+  """
+  ' PURPOSE
+  '   Returns the process-wide query result cache of the given model,
+  '   creating it on first use.
+  ' PARAMETERS
+  '   <class MyModel extends Model model>
+  ' RETURNS
+  '   <DocumentCache cache> or None if the model does not cache queries
+  """
+  if not model._query_cache:
+    return None
+  cache = _query_caches.get(model)
+  if cache is None:
+    with _lock:
+      cache = _query_caches.get(model)
+      if cache is None:
+        cache = _query_caches[model] = DocumentCache(model._query_cache_size, model._query_cache_ttl)
+  return cache
+
+
+def get_generation(model):
+  """
+  ' PURPOSE
+  '   Returns the write generation of the given model.
+  ' PARAMETERS
+  '   <class MyModel extends Model model>
+  ' RETURNS
+  '   <int generation>
+  """
+  return _generations.get(model, 0)
+
+
+def invalidate_queries(model):
+  """
+  ' PURPOSE
+  '   Called by the datastore classes once a write to the given model
+  '   completes. Bumps its generation so that no query result read
+  '   before the write is served again.
+  ' PARAMETERS
+  '   <class MyModel extends Model model>
+  ' RETURNS
+  '   Nothing
+  ' NOTES
+  '   1. Must only be called after the write is applied. Otherwise a
+  '      query racing the write could cache what it read before the
+  '      write under the new generation.
+  """
+  with _lock:
+    _generations[model] = _generations.get(model, 0) + 1
+
+
+""" COUNT CACHE """
+# counts memoized by Query.count(cache_ttl=...) keyed by (kind, frozen
+# filter, limit). Each entry expires after the ttl it was counted with.
+COUNT_CACHE_SIZE = 1000
+_count_cache = LRUCache(COUNT_CACHE_SIZE)
+
+
+def get_count_cache():
+  """
+  ' PURPOSE
+  '   Returns the process-wide cache of query counts.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <LRUCache cache>
+  """
+  return _count_cache
+
+
+def cache_stats():
+  """
+  ' PURPOSE
+  '   Reports the usage of every model's document cache.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <dict stats> kind name mapped to LRUCache.stats()
+  """
+  return dict((model.__name__, cache.stats()) for model, cache in list(_caches.items()))
+
+
+def query_cache_stats():
+  """
+  ' PURPOSE
+  '   Reports the usage of every model's query result cache.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <dict stats> kind name mapped to LRUCache.stats()
+  """
+  return dict((model.__name__, cache.stats()) for model, cache in list(_query_caches.items()))
+
+
+def clear_caches():
+  """
+  ' PURPOSE
+  '   Empties every model's document and query result cache, and the
+  '   cache of query counts.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   Nothing
+  """
+  for cache in list(_caches.values()) + list(_query_caches.values()):
+    cache.clear()
+  _count_cache.clear()
@@ -0,0 +1,133 @@
+""" LOCAL IMPORTS """
+from .properties import Property
+
+
+class _Never(object):
+  """
+  ' PURPOSE
+  '   A type no value ever has. Used as the fast path type of fields
+  '   that must always go through their property.
+  """
+  pass
+
+
+class Codec(object):
+  """
+  ' PURPOSE
+  '   Packs and unpacks the documents of one model. Built once per
+  '   model by PropertiedClass so that the work of looking up each
+  '   property, its type and its options is done at class creation
+  '   rather than for every value of every entity.
+  '
+  ' NOTES
+  '   1. Properties flagged as identity (their packed and unpacked
+  '      values are the same object, ex. StringProperty) skip their
+  '      property altogether whenever the value has exactly the
+  '      property's type. None, subclasses and wrong types still go
+  '      through Property._pack/_unpack, so defaults, required checks
+  '      and errors behave exactly as before.
+  '   2. Any other property, including custom Property subclasses,
+  '      falls back to the generic Property._pack/_unpack path.
+  """
+
+  def __init__(self, props):
+    """
+    ' PURPOSE
+    '   Specializes the codec for the given properties.
+    ' PARAMETERS
+    '   <PropertyList props>
+    ' RETURNS
+    '   <Codec codec>
+    """
+    self._encoders = []
+    self._decoders = {}
+    for prop in props:
+      fast = _Never
+      decoder = prop._unpack
+      if _is_identity(prop):
+        if prop.is_multiple():
+          decoder = _copy_list(prop)
+        else:
+          fast = prop.type()
+      self._encoders.append((prop.name(), prop._position, fast, prop._pack))
+      self._decoders[prop.name()] = (prop._position, fast, decoder)
+
+  def encode(self, values):
+    """
+    ' PURPOSE
+    '   Packs an entity's values into a document.
+    ' PARAMETERS
+    '   <list values> see Model._values
+    ' RETURNS
+    '   <dict document>
+    """
+    document = {}
+    for name, position, fast, encoder in self._encoders:
+      value = values[position]
+      document[name] = value if value.__class__ is fast else encoder(value)
+    return document
+
+  def decode(self, document, values):
+    """
+    ' PURPOSE
+    '   Unpacks a document into an entity's values.
+    ' PARAMETERS
+    '   <dict document>
+    '   <list values> see Model._values, updated in place
+    ' RETURNS
+    '   <list values>
+    ' NOTES
+    '   1. '_id' and any field no longer declared by the model are
+    '      ignored.
+    """
+    decoders = self._decoders
+    for name, value in document.items():
+      field = decoders.get(name)
+      if field is None:
+        continue
+      position, fast, decoder = field
+      values[position] = value if value.__class__ is fast else decoder(value)
+    return values
+
+
+def _is_identity(prop):
+  """
+  ' PURPOSE
+  '   Whether the given property is flagged as identity by the same
+  '   class that defines its type, pack and unpack methods, with the
+  '   generic _pack, _unpack and _checktype of Property. A subclass of
+  '   an identity property overriding any of them (ex. to validate
+  '   values in _checktype) is not identity.
+  ' PARAMETERS
+  '   <Property prop>
+  ' RETURNS
+  '   <bool identity>
+  """
+  def owner(attribute):
+    for kind in type(prop).__mro__:
+      if attribute in kind.__dict__:
+        return kind
+  declared = owner('_identity')
+  return (bool(prop._identity) and
+          all(owner(name) is declared for name in ('type', 'pack', 'unpack')) and
+          all(owner(name) is Property for name in ('_pack', '_unpack', '_checktype')))
+
+
+def _copy_list(prop):
+  """
+  ' PURPOSE
+  '   Builds the decoder of a multiple identity property. Stored lists
+  '   are copied rather than unpacked item by item; a copy is still
+  '   needed so that changing the entity's list in place does not also
+  '   change the document it was loaded from.
+  ' PARAMETERS
+  '   <Property prop>
+  ' RETURNS
+  '   <function decoder(object value)>
+  """
+  generic = prop._unpack
+  def decode(value):
+    if value.__class__ is list:
+      return list(value)
+    return generic(value)
+  return decode
@@ -0,0 +1,214 @@
+""" GLOBAL IMPORTS """
+import asyncio
+import os
+import threading
+
+
+""" MONGO IMPORTS """
+from pymongo import MongoClient
+
+
+""" CONNECTION SETTINGS """
+# the settings used whenever a client is created. Clients are only
+# created on first use so configure must simply be called before
+# the first datastore operation.
+_settings = {
+  'uri': 'mongodb://localhost:27017',
+  'database': 'develop_database',
+  'options': {},
+  'client': None,
+  'async_client': None
+}
+
+# the first pymongo release shipping AsyncMongoClient
+ASYNC_PYMONGO_VERSION = '4.9'
+
+# the live clients along with the id of the process that created
+# them. Clients are not fork-safe, so a forked worker discards the
+# inherited client and creates its own pool (see _reset_after_fork;
+# the pid check also covers platforms without register_at_fork).
+_client = None
+_client_pid = None
+_async_client = None
+_async_client_pid = None
+_lock = threading.Lock()
+
+# the pending closes of discarded async clients, see _close_async_client
+_closing = set()
+
+
+def _reset_after_fork():
+  """
+  ' PURPOSE
+  '   Runs in a forked child. The child may inherit _lock held by a
+  '   thread that does not exist there, so it gets a fresh lock along
+  '   with empty clients that are created again on first use.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   Nothing
+  """
+  global _lock, _client, _client_pid, _async_client, _async_client_pid
+  _lock = threading.Lock()
+  _client = _client_pid = None
+  _async_client = _async_client_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure(uri=None, database=None, max_pool_size=None, compressors=None, client=None, async_client=None, **options):
+  """
+  ' PURPOSE
+  '   Configures the MongoDB connection used by every model. Any
+  '   client created by a previous configuration is discarded and a
+  '   new one is lazily created on the next datastore operation.
+  ' PARAMETERS
+  '   optional <str uri> a mongodb:// connection string
+  '   optional <str database> the database name
+  '   optional <int max_pool_size> the max connections per pool
+  '   optional <list str compressors> ex. ['zstd', 'snappy', 'zlib']
+  '   optional <MongoClient client> use an existing client (or an
+  '                                 in-process stand-in such as mongomock)
+  '                                 instead of creating one
+  '   optional <AsyncMongoClient async_client> use an existing client for
+  '                                            the async API instead of
+  '                                            creating one
+  '   optional **options any other MongoClient keyword option
+  '                      ex. serverSelectionTimeoutMS=2000
+  ' RETURNS
+  '   Nothing
+  ' EXAMPLE USAGE
+  '   -> db.configure(uri='mongodb://db1,db2/?replicaSet=rs0', database='app',
+  '   ->              max_pool_size=50, compressors=['zstd'])
+  """
+  global _client, _client_pid, _async_client, _async_client_pid
+
+  if not max_pool_size is None:
+    options['maxPoolSize'] = max_pool_size
+  if not compressors is None:
+    options['compressors'] = compressors
+
+  with _lock:
+    # only close clients created by TableMongo itself
+    if _client is not None and _client_pid == os.getpid() and _settings['client'] is None:
+      _client.close()
+    if _async_client is not None and _async_client_pid == os.getpid() and _settings['async_client'] is None:
+      _close_async_client(_async_client)
+
+    if uri: _settings['uri'] = uri
+    if database: _settings['database'] = database
+    _settings['options'] = options
+    _settings['client'] = client
+    _settings['async_client'] = async_client
+
+    _client = _client_pid = None
+    _async_client = _async_client_pid = None
+
+
+def get_client():
+  """
+  ' PURPOSE
+  '   Returns the MongoClient for the current process, creating it on
+  '   first use or after a fork.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <MongoClient client>
+  """
+  global _client, _client_pid
+
+  pid = os.getpid()
+  if _client is None or _client_pid != pid:
+    with _lock:
+      if _client is None or _client_pid != pid:
+        if _settings['client'] is not None:
+          _client = _settings['client']
+        else:
+          _client = MongoClient(_settings['uri'], **_settings['options'])
+        _client_pid = pid
+  return _client
+
+
+def get_database():
+  """
+  ' PURPOSE
+  '   Returns the configured database of the current process' client.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   PyMongo database
+  """
+  return get_client()[_settings['database']]
+
+
+def get_async_client():
+  """
+  ' PURPOSE
+  '   Returns the async client for the current process, creating it
+  '   on first use or after a fork.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <AsyncMongoClient client>
+  ' NOTES
+  '   1. When configure was given a sync client but no async client,
+  '      an error is raised rather than silently connecting the async
+  '      API to the default uri.
+  """
+  global _async_client, _async_client_pid
+
+  pid = os.getpid()
+  if _async_client is None or _async_client_pid != pid:
+    with _lock:
+      if _async_client is None or _async_client_pid != pid:
+        if _settings['async_client'] is not None:
+          _async_client = _settings['async_client']
+        elif _settings['client'] is not None:
+          raise RuntimeError('configure was given a client but no async_client for the async API')
+        else:
+          # the async driver ships with newer versions of pymongo. Hence
+          # the import is only made here so the sync API keeps working
+          # with older versions.
+          try:
+            from pymongo import AsyncMongoClient
+          except ImportError:
+            raise ImportError('The async API requires pymongo >= %s' % ASYNC_PYMONGO_VERSION)
+          _async_client = AsyncMongoClient(_settings['uri'], **_settings['options'])
+        _async_client_pid = pid
+  return _async_client
+
+
+def _close_async_client(client):
+  """
+  ' PURPOSE
+  '   Closes an async client discarded by configure. Closing is a
+  '   coroutine, so it is scheduled on the running event loop when
+  '   there is one and otherwise left to the client's finalizer.
+  ' PARAMETERS
+  '   <AsyncMongoClient client>
+  ' RETURNS
+  '   Nothing
+  """
+  try:
+    loop = asyncio.get_running_loop()
+  except RuntimeError:
+    return
+  # the loop only keeps a weak reference to its tasks
+  task = loop.create_task(client.close())
+  _closing.add(task)
+  task.add_done_callback(_closing.discard)
+
+
+def get_async_database():
+  """
+  ' PURPOSE
+  '   Returns the configured database of the current process' async
+  '   client.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   PyMongo async database
+  """
+  return get_async_client()[_settings['database']]
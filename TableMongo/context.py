@@ -0,0 +1,180 @@
+""" GLOBAL IMPORTS """
+import contextvars
+
+
+# the context active in the current thread or asyncio task
+_current = contextvars.ContextVar('TableMongo.context', default=None)
+
+
+class Context(object):
+  """
+  ' PURPOSE
+  '   An in-memory identity map of entities keyed by Key. While a
+  '   context is active, Key.get (and everything built on it, such as
+  '   get_by_id or ModelProperty references) loads each entity at most
+  '   once and returns the same instance for repeated gets. Saves and
+  '   deletes keep the map up to date.
+  '
+  ' EXAMPLE USAGE
+  '   -> with db.Context():
+  '   ->   user = User.get_by_id(id)
+  '   ->   assert User.get_by_id(id) is user
+  '
+  '   Contexts are usually opened once per web request, see
+  '   ContextMiddleware.
+  """
+
+  def __init__(self):
+    """
+    ' PURPOSE
+    '   Initializes an empty context.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <Context context>
+    """
+    self._entities = {}
+    self._tokens = []
+
+  def __contains__(self, key):
+    return key in self._entities
+
+  def get(self, key):
+    """
+    ' PURPOSE
+    '   Returns the entity held for the given key.
+    ' PARAMETERS
+    '   <Key key>
+    ' RETURNS
+    '   <MyModel extends Model entity> or None if the entity is
+    '   known not to exist
+    ' NOTES
+    '   1. Check 'key in context' first to tell a known missing entity
+    '      from a key that has not been loaded yet.
+    """
+    return self._entities.get(key)
+
+  def set(self, key, entity):
+    """
+    ' PURPOSE
+    '   Holds the given entity (or None for a missing entity).
+    ' PARAMETERS
+    '   <Key key>
+    '   <MyModel extends Model entity>
+    ' RETURNS
+    '   Nothing
+    """
+    self._entities[key] = entity
+
+  def evict(self, key):
+    """
+    ' PURPOSE
+    '   Forgets the entity held for the given key if there is one.
+    ' PARAMETERS
+    '   <Key key>
+    ' RETURNS
+    '   Nothing
+    """
+    self._entities.pop(key, None)
+
+  def evict_kind(self, model):
+    """
+    ' PURPOSE
+    '   Forgets every entity of the given model.
+    ' PARAMETERS
+    '   <class MyModel extends Model model>
+    ' RETURNS
+    '   Nothing
+    """
+    for key in [key for key in self._entities if key.model is model]:
+      del self._entities[key]
+
+  def clear(self):
+    """
+    ' PURPOSE
+    '   Forgets every entity held by this context.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   Nothing
+    """
+    self._entities.clear()
+
+  def __enter__(self):
+    self._tokens.append(_current.set(self))
+    return self
+
+  def __exit__(self, *args):
+    _current.reset(self._tokens.pop())
+    self.clear()
+
+
+def get_context():
+  """
+  ' PURPOSE
+  '   Returns the active context.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <Context context> or None if no context is active
+  """
+  return _current.get()
+
+
+class ContextMiddleware(object):
+  """
+  ' PURPOSE
+  '   WSGI middleware that runs every request inside a fresh Context.
+  '   The context stays active while the response body is iterated and
+  '   is exited when the server closes the response, so streamed
+  '   bodies are neither buffered nor run outside of it.
+  '
+  ' EXAMPLE USAGE
+  '   -> app.wsgi_app = db.ContextMiddleware(app.wsgi_app)
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  def __call__(self, environ, start_response):
+    context = Context()
+    context.__enter__()
+    try:
+      response = self.app(environ, start_response)
+    except:
+      context.__exit__(None, None, None)
+      raise
+
+    # file bodies never touch the datastore. Returned as is so the
+    # server can still send them efficiently (ex. with sendfile).
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if isinstance(file_wrapper, type) and isinstance(response, file_wrapper):
+      context.__exit__(None, None, None)
+      return response
+    return _ContextResponse(response, context)
+
+
+class _ContextResponse(object):
+  """
+  ' PURPOSE
+  '   Streams a WSGI response body and exits its request's context
+  '   once the server closes the response.
+  """
+
+  def __init__(self, response, context):
+    self._response = response
+    self._context = context
+    self._closed = False
+
+  def __iter__(self):
+    return iter(self._response)
+
+  def close(self):
+    if self._closed:
+      return
+    self._closed = True
+    try:
+      if hasattr(self._response, 'close'):
+        self._response.close()
+    finally:
+      self._context.__exit__(None, None, None)
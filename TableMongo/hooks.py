@@ -0,0 +1,170 @@
+""" GLOBAL IMPORTS """
+import time
+
+
+""" MONGO IMPORTS """
+import bson as bsonlib
+
+
+class Event(object):
+  """
+  ' PURPOSE
+  '   Describes a single datastore operation. The same instance is
+  '   handed to the pre hooks before the operation runs and to the
+  '   post hooks once it completes.
+  '
+  ' ATTRIBUTES
+  '   <str operation> 'get', 'get_multi', 'save', 'put_multi', 'delete',
+  '                   'delete_multi', 'delete_all', 'ingest', 'query', 'count'
+  '                   or 'aggregate'
+  '   <str kind> the model's name
+  '   <dict filter> the filter sent to the server, if any
+  '   <float duration> seconds taken, set before the post hooks run
+  '   <int documents> documents returned or written, where known
+  '   <int bytes> BSON size of the documents, where known
+  '   <dict tags> free for hooks to share data between pre and post
+  """
+
+  def __init__(self, operation, kind, filter=None):
+    self.operation = operation
+    self.kind = kind
+    self.filter = filter
+    self.duration = None
+    self.documents = None
+    self.bytes = None
+    self.tags = {}
+    self._started = None
+
+  def shape(self):
+    """
+    ' PURPOSE
+    '   Returns the filter with every compared value replaced by '?'
+    '   so that operations can be grouped by query shape.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <object shape>
+    """
+    if self.filter is None:
+      return None
+    return _shape(self.filter)
+
+  def __repr__(self):
+    """
+    ' see self.__str__
+    """
+    return self.__str__()
+
+  def __str__(self):
+    """
+    ' PURPOSE
+    '   Condensed, unique representation of the Event data.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <str str_value>
+    """
+    return 'Event(%s, kind=\'%s\', filter=%s, duration=%s, documents=%s)' % (
+      self.operation, self.kind, self.shape(), self.duration, self.documents)
+
+
+def _shape(value):
+  if isinstance(value, dict):
+    return dict((key, _shape(item) if key.startswith('$') or isinstance(item, dict) else '?')
+                for key, item in value.items())
+  if isinstance(value, list) and any(isinstance(item, dict) for item in value):
+    return [_shape(item) for item in value]
+  return '?'
+
+
+_pre_hooks = []
+_post_hooks = []
+
+
+def add_pre_hook(callback):
+  """
+  ' PURPOSE
+  '   Registers a callback run with the Event before every operation.
+  ' PARAMETERS
+  '   <function callback(Event event)>
+  ' RETURNS
+  '   <function callback>
+  """
+  _pre_hooks.append(callback)
+  return callback
+
+
+def add_post_hook(callback):
+  """
+  ' PURPOSE
+  '   Registers a callback run with the Event after every operation
+  '   completes successfully.
+  ' PARAMETERS
+  '   <function callback(Event event)>
+  ' RETURNS
+  '   <function callback>
+  """
+  _post_hooks.append(callback)
+  return callback
+
+
+def remove_hook(callback):
+  """
+  ' PURPOSE
+  '   Unregisters a pre or post hook.
+  ' PARAMETERS
+  '   <function callback>
+  ' RETURNS
+  '   Nothing
+  """
+  for hooks in (_pre_hooks, _post_hooks):
+    while callback in hooks:
+      hooks.remove(callback)
+
+
+def start(operation, model, filter=None):
+  """
+  ' PURPOSE
+  '   Called by the datastore classes before running an operation.
+  ' PARAMETERS
+  '   <str operation>
+  '   <class MyModel extends Model model>
+  '   optional <dict filter>
+  ' RETURNS
+  '   <Event event> or None when no hooks are registered, in which
+  '   case the caller skips finish altogether.
+  """
+  if not _pre_hooks and not _post_hooks:
+    return None
+  event = Event(operation, model.__name__, filter)
+  for hook in _pre_hooks:
+    hook(event)
+  event._started = time.perf_counter()
+  return event
+
+
+def finish(event, documents=None, payload=None, duration=None):
+  """
+  ' PURPOSE
+  '   Called by the datastore classes once an operation completes.
+  ' PARAMETERS
+  '   <Event event>
+  '   optional <int documents> documents returned or written
+  '   optional <list dict payload> the documents read or written,
+  '                                used to measure their size
+  '   optional <float duration> seconds spent reading, for streamed
+  '                             results. Defaults to the time since
+  '                             start.
+  ' RETURNS
+  '   Nothing
+  """
+  if duration is None:
+    duration = time.perf_counter() - event._started
+  event.duration = duration
+  if payload is not None:
+    event.documents = len(payload)
+    event.bytes = sum(len(bsonlib.encode(document)) for document in payload)
+  if documents is not None:
+    event.documents = documents
+  for hook in _post_hooks:
+    hook(event)
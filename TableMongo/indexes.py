@@ -0,0 +1,218 @@
+""" LOCAL IMPORTS """
+from .properties import Property, SortDescriptor
+
+
+""" MONGO IMPORTS """
+import pymongo
+
+
+class Index(object):
+  """
+  ' PURPOSE
+  '   Declares a (possibly compound) index over a model's properties.
+  '   Single property indexes are usually declared on the property
+  '   itself with indexed=True or unique=True. Compound indexes are
+  '   listed in the model's _indexes class attribute.
+  '
+  ' EXAMPLE USAGE
+  '   -> class Trip(db.Model):
+  '   ->   author = db.ModelProperty(User)
+  '   ->   created = db.FloatProperty()
+  '   ->   _indexes = [db.Index(author, -created)]
+  '
+  '   A plain tuple such as (author, -created) is also accepted.
+  """
+
+  DIRECTIONS = {
+    SortDescriptor.ASCENDING: pymongo.ASCENDING,
+    SortDescriptor.DESCENDING: pymongo.DESCENDING
+  }
+
+  def __init__(self, *fields, **options):
+    """
+    ' PURPOSE
+    '   Initializes the index with its fields, in order.
+    ' PARAMETERS
+    '   <Property|SortDescriptor field1>
+    '   ...
+    '   <Property|SortDescriptor fieldN>
+    '   optional <bool unique>
+    '   optional <bool sparse>
+    '   optional <str name> defaults to pymongo's naming scheme
+    ' RETURNS
+    '   <Index index>
+    ' NOTES
+    '   1. A bare property is indexed ascending.
+    """
+    if not fields:
+      raise ValueError('An index requires at least one property')
+    for field in fields:
+      if not isinstance(field, (Property, SortDescriptor)):
+        raise ValueError('Expected Property or SortDescriptor. Instead got: %s' % field)
+
+    self._fields = fields
+    self.unique = options.pop('unique', False)
+    self.sparse = options.pop('sparse', False)
+    self._name = options.pop('name', None)
+    if options:
+      raise ValueError('Unexpected index options: %s' % ', '.join(options))
+
+  def keys(self):
+    """
+    ' PURPOSE
+    '   Returns the pymongo key specification of this index.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <list tuple(str name, int direction) keys>
+    ' NOTES
+    '   1. Properties only know their names once their model class
+    '      has been created, hence this is computed lazily.
+    """
+    keys = []
+    for field in self._fields:
+      if isinstance(field, Property):
+        field = +field
+      keys.append((field.property.name(), self.DIRECTIONS[field.direction]))
+    return keys
+
+  def name(self):
+    """
+    ' PURPOSE
+    '   Returns the name of this index.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <str name>
+    """
+    if self._name:
+      return self._name
+    return '_'.join('%s_%s' % key for key in self.keys())
+
+  def options(self):
+    """
+    ' PURPOSE
+    '   Returns the options this index is created with.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <dict options>
+    """
+    options = {}
+    if self.unique: options['unique'] = True
+    if self.sparse: options['sparse'] = True
+    return options
+
+  def index_model(self):
+    """
+    ' PURPOSE
+    '   Converts this index into a pymongo IndexModel.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <IndexModel index_model>
+    """
+    return pymongo.IndexModel(self.keys(), name=self.name(), **self.options())
+
+  def matches(self, info):
+    """
+    ' PURPOSE
+    '   Whether an existing index (as described by index_information)
+    '   has the same keys and options as this one.
+    ' PARAMETERS
+    '   <dict info>
+    ' RETURNS
+    '   <bool matches>
+    """
+    existing = [(name, int(direction)) for name, direction in info['key']]
+    return (existing == self.keys() and
+            bool(info.get('unique')) == self.unique and
+            bool(info.get('sparse')) == self.sparse)
+
+  @classmethod
+  def from_declaration(cls, declaration):
+    """
+    ' PURPOSE
+    '   Normalizes an entry of a model's _indexes attribute.
+    ' PARAMETERS
+    '   <Index|tuple|Property|SortDescriptor declaration>
+    ' RETURNS
+    '   <Index index>
+    """
+    if isinstance(declaration, Index):
+      return declaration
+    if isinstance(declaration, (tuple, list)):
+      return Index(*declaration)
+    return Index(declaration)
+
+  def __repr__(self):
+    """
+    ' see self.__str__
+    """
+    return self.__str__()
+
+  def __str__(self):
+    """
+    ' PURPOSE
+    '   Condensed, unique representation of the Index data.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <str str_value>
+    """
+    options = ''.join(', %s=True' % option for option in sorted(self.options()))
+    return 'Index(%s%s)' % (', '.join(repr(field) for field in self._fields), options)
+
+
+def ensure_indexes(models=None, drop_stale=False):
+  """
+  ' PURPOSE
+  '   Creates every declared index that does not exist yet. Safe to
+  '   call on every deploy: indexes that already exist are left
+  '   untouched and indexes whose keys or options changed are rebuilt.
+  ' PARAMETERS
+  '   optional <list class MyModel extends Model models> defaults to
+  '                                                      every model
+  '   optional <bool drop_stale> also drop existing indexes that are
+  '                              no longer declared
+  ' RETURNS
+  '   <dict report> kind name mapped to a dict of index names under
+  '                 'created', 'rebuilt', 'unchanged' and 'stale'
+  ' NOTES
+  '   1. Every model must have already been imported.
+  """
+  from .model import get_kinds
+
+  if models is None:
+    models = get_kinds()
+
+  report = {}
+  for model in models:
+    collection = model._collection()
+    existing = collection.index_information()
+    declared = dict((index.name(), index) for index in model._indexes)
+
+    result = { 'created': [], 'rebuilt': [], 'unchanged': [], 'stale': [] }
+    create = []
+    for name, index in declared.items():
+      if not name in existing:
+        result['created'].append(name)
+        create.append(index.index_model())
+      elif not index.matches(existing[name]):
+        collection.drop_index(name)
+        result['rebuilt'].append(name)
+        create.append(index.index_model())
+      else:
+        result['unchanged'].append(name)
+
+    for name in existing:
+      if name != '_id_' and not name in declared:
+        result['stale'].append(name)
+        if drop_stale:
+          collection.drop_index(name)
+
+    if create:
+      collection.create_indexes(create)
+    report[model.__name__] = result
+
+  return report
@@ -56,8 +56,8 @@ def staticresources(filename):
 
 
 def get_models():
-  from ..model import Model
-  return [model.__name__ for model in Model.__subclasses__()]
+  from ..model import get_kinds
+  return [model.__name__ for model in get_kinds()]
 
 def get_model(modelname):
   from ..key import Key
@@ -3,7 +3,14 @@ import base64
 
 
 """ LOCAL IMPORTS """
-# At the bottom of the file
+from .context import get_context
+from .cache import get_cache, invalidate_queries
+from . import hooks
+# Model at the bottom of the file
+
+
+""" MONGO IMPORTS """
+from bson.errors import InvalidId
 
 
 class Key(object):
@@ -23,6 +30,8 @@ class Key(object):
   '   ->  entity = Key(urlsafe = 'askjhd872hd92jio34==').get()
   """
 
+  __slots__ = ('model', 'id')
+
   @classmethod
   def get_model(self, modelname):
     """
@@ -35,15 +44,103 @@ class Key(object):
     ' NOTES
     '   1. The subclass must have already been imported and thus
     '      already exists in memory.
+    '   2. Any subclass in the hierarchy resolves, in constant time.
     """
-    models = Model.__subclasses__()
-    for model in models:
-      if modelname == model.__name__:
-        return model
-        break
-    else:
+    model = get_kind(modelname)
+    if model is None:
       raise ValueError('Invalid modelname')
+    return model
 
+  @classmethod
+  def get_multi(cls, keys):
+    """
+    ' PURPOSE
+    '   Gets the entities associated with many keys using a single
+    '   $in lookup per kind (chunked by BATCH_SIZE) instead of a
+    '   round trip per key.
+    ' PARAMETERS
+    '   <list Key keys> may mix kinds
+    ' RETURNS
+    '   <list MyModel extends Model entity> in the same order as keys,
+    '                                       None for missing entities.
+    """
+    from .model import ObjectId, batched
+    keys = list(keys)
+    context = get_context()
+    found = {}
+    ids_by_model = {}
+    for key in keys:
+      if context and key in context:
+        continue
+      
+      cache = get_cache(key.model)
+      document = cache.get(str(key.id)) if cache else None
+      if document:
+        found[(key.model, str(key.id))] = key.model._from_document(document)
+        continue
+      
+      try:
+        ids_by_model.setdefault(key.model, set()).add(ObjectId(key.id))
+      except (InvalidId, TypeError):
+        pass
+    
+    for model, ids in ids_by_model.items():
+      event = hooks.start('get_multi', model)
+      collection = model._collection()
+      cache = get_cache(model)
+      documents = []
+      for chunk in batched(list(ids)):
+        for document in collection.find({ '_id': { '$in': chunk } }):
+          documents.append(document)
+          found[(model, str(document['_id']))] = model._from_document(document)
+          if cache:
+            cache.set(str(document['_id']), document)
+      if event: hooks.finish(event, payload=documents)
+    
+    entities = []
+    for key in keys:
+      if context and key in context:
+        entities.append(context.get(key))
+        continue
+      entity = found.get((key.model, str(key.id)))
+      if context:
+        context.set(key, entity)
+      entities.append(entity)
+    return entities
+  
+  @classmethod
+  def delete_multi(cls, keys):
+    """
+    ' PURPOSE
+    '   Deletes the entities associated with many keys using a single
+    '   delete_many per kind (chunked by BATCH_SIZE).
+    ' PARAMETERS
+    '   <list Key keys> may mix kinds
+    ' RETURNS
+    '   <int deleted> the number of deleted entities
+    """
+    from .model import ObjectId, batched
+    keys_by_model = {}
+    for key in keys:
+      keys_by_model.setdefault(key.model, []).append(key)
+    
+    deleted = 0
+    for model, model_keys in keys_by_model.items():
+      ids = set(ObjectId(key.id) for key in model_keys)
+      event = hooks.start('delete_multi', model)
+      collection = model._collection()
+      deleted_kind = 0
+      for chunk in batched(list(ids)):
+        result = collection.delete_many({ '_id': { '$in': chunk } })
+        deleted_kind += result.deleted_count
+      # only once deleted, so a concurrent get cannot cache them again
+      for key in model_keys:
+        model._forget(key)
+      invalidate_queries(model)
+      if event: hooks.finish(event, documents=deleted_kind)
+      deleted += deleted_kind
+    return deleted
+  
   def __init__(self, model=None, id=None, urlsafe=None, serial=None):
     """
     ' PURPOSE
@@ -111,10 +208,34 @@ class Key(object):
     ' RETURNS
     '   <int deleted> the number of deleted entities
     """
-    from .model import rawdb, ObjectId
-    collection = getattr(rawdb, self.model.__name__)
-    result = collection.remove({ '_id': ObjectId(self.id) })
-    return result['n']
+    from .model import ObjectId
+    filter = { '_id': ObjectId(self.id) }
+    event = hooks.start('delete', self.model, filter)
+    collection = self.model._collection()
+    result = collection.delete_one(filter)
+    self.model._forget(self)
+    invalidate_queries(self.model)
+    if event: hooks.finish(event, documents=result.deleted_count)
+    return result.deleted_count
+  
+  async def delete_async(self):
+    """
+    ' PURPOSE
+    '   Awaitable counterpart of delete using the async driver.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <int deleted> the number of deleted entities
+    """
+    from .model import ObjectId
+    filter = { '_id': ObjectId(self.id) }
+    event = hooks.start('delete', self.model, filter)
+    collection = self.model._async_collection()
+    result = await collection.delete_one(filter)
+    self.model._forget(self)
+    invalidate_queries(self.model)
+    if event: hooks.finish(event, documents=result.deleted_count)
+    return result.deleted_count
 
   def get(self):
     """
@@ -125,12 +246,95 @@ class Key(object):
     ' RETURNS
     '   <MyModel extends Model entity> if entity exists
     '   None if entity does not exist.
+    ' NOTES
+    '   1. Inside an active Context the entity is loaded at most once
+    '      and repeated gets return the same instance.
+    '   2. Only a missing entity or an invalid id return None. Any
+    '      other error (ex. AutoReconnect) is raised and not held by
+    '      the Context, so a later get tries again.
     """
+    from .model import ObjectId, EntityNotFoundError
+    context = get_context()
+    if context and self in context:
+      return context.get(self)
+    
     try:
-      return self.model(key=self)
-    except:
-      return None
+      ObjectId(self.id)
+    except (InvalidId, TypeError):
+      entity = None
+    else:
+      try:
+        entity = self.model(key=self)
+      except EntityNotFoundError:
+        entity = None
+    
+    if context:
+      context.set(self, entity)
+    return entity
+  
+  async def get_async(self):
+    """
+    ' PURPOSE
+    '   Awaitable counterpart of get using the async driver.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <MyModel extends Model entity> if entity exists
+    '   None if entity does not exist.
+    """
+    from .model import ObjectId
+    context = get_context()
+    if context and self in context:
+      return context.get(self)
+    
+    cache = get_cache(self.model)
+    document = cache.get(str(self.id)) if cache else None
+    if document is None:
+      try:
+        id = ObjectId(self.id)
+      except (InvalidId, TypeError):
+        return None
+      event = hooks.start('get', self.model, { '_id': id })
+      document = await self.model._async_collection().find_one({ '_id': id })
+      if event: hooks.finish(event, payload=[document] if document else [])
+      if document and cache:
+        cache.set(str(self.id), document)
+    entity = self.model._from_document(document) if document else None
+    
+    if context:
+      context.set(self, entity)
+    return entity
 
+  def __eq__(self, other):
+    """
+    ' PURPOSE
+    '   Keys are equal when they identify the same entity.
+    ' PARAMETERS
+    '   <Key other>
+    ' RETURNS
+    '   <bool equal>
+    """
+    if not isinstance(other, Key):
+      return NotImplemented
+    return self.model is other.model and str(self.id) == str(other.id)
+  
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    if equal is NotImplemented:
+      return equal
+    return not equal
+  
+  def __hash__(self):
+    """
+    ' PURPOSE
+    '   Allows keys to be used in dicts and sets.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <int hash>
+    """
+    return hash((self.model.__name__, str(self.id)))
+  
   def __repr__(self):
     """
     ' see self.__str__
@@ -150,4 +354,4 @@ class Key(object):
 
 
 """ LOCAL IMPORTS (to allow circular imports) """
-from .model import Model
+from .model import Model, get_kind
@@ -1,18 +1,113 @@
+""" GLOBAL IMPORTS """
+import copy
+
+
 """ LOCAL IMPORTS """
-from .properties import Property, PropertyQuery, PropertyList
+from .properties import Property, PropertyList, ProjectionError, BadValueError, DanglingReferenceError, _UNLOADED, resolve_reference
 from .key import Key
 from .query import *
+from .connection import get_database, get_async_database
+from .context import get_context
+from .cache import get_cache, invalidate_queries
+from .indexes import Index
+from .codec import Codec
+from . import hooks
 
 
 """ MONGO IMPORTS """
-from pymongo import MongoClient
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
+import bson as bsonlib
+from bson.raw_bson import RawBSONDocument
 from bson.objectid import ObjectId
-from bson.errors import InvalidId
+from bson.errors import InvalidDocument
+
+
+""" BATCH OPERATIONS """
+# the max amount of documents sent in a single bulk command. This
+# keeps each request well under MongoDB's maximum message size.
+BATCH_SIZE = 1000
+
+# the max encoded size of the documents buffered by a single ingest
+# batch, keeping client memory bounded whatever the document sizes.
+BATCH_BYTES = 8 * 1024 * 1024
+
+
+def batched(items, size=BATCH_SIZE):
+  """
+  ' PURPOSE
+  '   Splits a list into consecutive chunks of at most size items.
+  ' PARAMETERS
+  '   <list items>
+  '   optional <int size>
+  ' RETURNS
+  '   <generator list chunk>
+  """
+  for start in range(0, len(items), size):
+    yield items[start:start+size]
+
+
+""" STORED DOCUMENTS """
+# values of these types can never be changed in place, so an entity's
+# snapshot of its stored document may share them with its values.
+_IMMUTABLE = frozenset([str, bytes, int, float, bool, type(None), ObjectId])
+
+
+def _snapshot(document):
+  """
+  ' PURPOSE
+  '   Copies a document so that no mutable value (ex. a list or a dict
+  '   a property unpacked as is) is shared with the entity holding it.
+  '   An in place change to the entity's value must not also change
+  '   the document it is compared against when saving.
+  ' PARAMETERS
+  '   <dict document>
+  ' RETURNS
+  '   <dict document>
+  """
+  copied = {}
+  for name, value in document.items():
+    copied[name] = value if value.__class__ in _IMMUTABLE else copy.deepcopy(value)
+  return copied
+
+
+""" KIND REGISTRY """
+# every Model subclass, however deeply nested, keyed by its kind name.
+# Keys resolve their model here on every KeyProperty/ModelProperty
+# unpack, so the lookup must stay a single dict access.
+_kinds = {}
+
+
+class DuplicateKindError(Exception):
+  pass
+
+
+class EntityNotFoundError(ValueError):
+  pass
+
 
+def get_kind(name):
+  """
+  ' PURPOSE
+  '   Given a kind name, returns the Model subclass.
+  ' PARAMETERS
+  '   <str name>
+  ' RETURNS
+  '   <class MyModel extends Model> or None if no such kind
+  """
+  return _kinds.get(name)
 
-""" MONGO DATABASE """
-mongo = MongoClient('localhost', 27017)
-rawdb = mongo.develop_database
+
+def get_kinds():
+  """
+  ' PURPOSE
+  '   Returns every defined Model subclass.
+  ' PARAMETERS
+  '   None
+  ' RETURNS
+  '   <list class MyModel extends Model> in definition order
+  """
+  return list(_kinds.values())
 
 
 class PropertiedClass(type):
@@ -21,24 +116,77 @@ class PropertiedClass(type):
   '   Meta Class to Model which upon Model creation investigates
   '   all properties and loads them with associated kind data.
   '   AKA. Finds all properties and tells them which model they belong to.
+  '   It also collects the model's index declarations (see Index),
+  '   builds the model's document codec (see Codec) and registers the
+  '   model by kind name (see get_kind).
+  ' NOTES
+  '   1. Subclasses of models inherit their parents' properties and
+  '      indexes but are stored as their own kind.
+  '   2. Kind names are unique. Defining a second, unrelated model with
+  '      an existing name raises DuplicateKindError. Redefining the same
+  '      class (same module and qualified name, as when reloading a
+  '      module) replaces the previous definition.
   """
   
   def __new__(cls, name, parents, dct):
+    bases = [parent for parent in parents if isinstance(parent, PropertiedClass)]
+    
+    # entities keep their values in a single list (see Model._values)
+    # so compact models need no per-instance __dict__
+    if bases and not '__slots__' in dct and dct.get('_compact', all(parent._compact for parent in bases)):
+      dct = dict(dct, __slots__=())
+    
     self = super(PropertiedClass, cls).__new__(cls, name, parents, dct)
     
+    if not bases:
+      # the Model base class itself
+      self._properties = PropertyList()
+      self._indexes = ()
+      self._codec = Codec(self._properties)
+      return self
+    
+    previous = _kinds.get(name)
+    if previous is not None and (previous.__module__, previous.__qualname__) != (self.__module__, self.__qualname__):
+      raise DuplicateKindError('Kind %s is already defined by %s.%s' % (
+        name, previous.__module__, previous.__qualname__))
+    
     props = []
+    indexes = []
+    
+    for parent in bases:
+      for prop in parent._properties:
+        if not prop.name() in dct and not prop.name() in PropertyList(props):
+          # every model owns its properties since their position in
+          # the values list may differ from the parent's
+          prop = copy.copy(prop)
+          setattr(self, prop.name(), prop)
+          props.append(prop)
+      indexes.extend(parent._indexes)
     
     for key, value in dct.items():
       if isinstance(value, Property):
         value._load_meta(kind=self, name=key)
         props.append(value)
+        if value.is_indexed():
+          indexes.append(Index(value, unique=value.is_unique()))
+    
+    for position, prop in enumerate(props):
+      prop._load_meta(kind=self, name=prop.name(), position=position)
+    
+    for declaration in dct.get('_indexes', ()):
+      indexes.append(Index.from_declaration(declaration))
     
     self._properties = PropertyList(props)
+    self._codec = Codec(self._properties)
+    # drop indexes both inherited and redeclared
+    self._indexes = tuple(dict((index.name(), index) for index in indexes).values())
+    
+    _kinds[name] = self
     
     return self
 
 
-class Model(object):
+class Model(object, metaclass=PropertiedClass):
   """
   ' PURPOSE
   '   The Model class is the superclass to all other database
@@ -74,7 +222,32 @@ class Model(object):
   '   -> matches = User.query(User.fullname == 'Jane Doe', User.age < 25, User.age > 18)
   """
   
-  __metaclass__ = PropertiedClass
+  # entities hold their property values in one list, ordered like
+  # properties(), rather than in a per-instance __dict__. Models opting
+  # in with _compact = True (and their subclasses) are also given empty
+  # __slots__ so entities take a fraction of the memory, at the cost of
+  # no longer accepting attributes other than their properties.
+  __slots__ = ('key', '_values', '_document', '_projection', '__weakref__')
+  _compact = False
+  
+  # compound index declarations, see Index and ensure_indexes.
+  _indexes = ()
+  
+  # opt in to the process-wide cache of packed documents which Key.get
+  # reads through and save/delete write through. Best suited to hot,
+  # rarely changing entities since writes made by other processes are
+  # only seen once an entry is evicted or expires.
+  _global_cache = False
+  _global_cache_size = 1000
+  _global_cache_ttl = None
+  
+  # opt in to the process-wide cache of query results which fetch and
+  # get read through. Every write made by this process invalidates the
+  # kind's cached results, writes made by other processes are only seen
+  # once a result is evicted or expires.
+  _query_cache = False
+  _query_cache_size = 1000
+  _query_cache_ttl = None
   
   @classmethod
   def _collection(cls):
@@ -86,7 +259,19 @@ class Model(object):
     ' RETURNS
     '   MongoDB collection
     """
-    return getattr(rawdb, cls.__name__)
+    return get_database()[cls.__name__]
+  
+  @classmethod
+  def _async_collection(cls):
+    """
+    ' PURPOSE
+    '   Returns the async MongoDB collection for this model.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   PyMongo async collection
+    """
+    return get_async_database()[cls.__name__]
   
   @classmethod
   def delete_all(cls):
@@ -97,10 +282,24 @@ class Model(object):
     '   None
     ' RETURNS
     '   <int deleted> the count of entities deleted
+    ' NOTES
+    '   1. The count is read from the collection metadata rather than
+    '      counted, so it may be approximate after an unclean shutdown.
     """
+    event = hooks.start('delete_all', cls)
     collection = cls._collection()
-    deleted = collection.count()
+    deleted = collection.estimated_document_count()
     collection.drop()
+    
+    # only once dropped, so a concurrent get cannot cache them again
+    context = get_context()
+    if context:
+      context.evict_kind(cls)
+    cache = get_cache(cls)
+    if cache:
+      cache.clear()
+    invalidate_queries(cls)
+    if event: hooks.finish(event, documents=deleted)
     return deleted
   
   # count = 0 means no limit
@@ -163,8 +362,181 @@ class Model(object):
     """
     return cls.key_from_id(id).get()
   
+  @classmethod
+  def put_multi(cls, entities):
+    """
+    ' PURPOSE
+    '   Saves many entities using one insert_many for new entities
+    '   and one bulk_write for existing entities per collection
+    '   (chunked by BATCH_SIZE) instead of a round trip per entity.
+    ' PARAMETERS
+    '   <list MyModel extends Model entities> may mix kinds
+    ' RETURNS
+    '   <list MyModel extends Model entities>
+    ' NOTES
+    '   1. Like save, new entities are assigned their key.
+    '   2. References (see ModelReference) are saved as the entity
+    '      they stand for.
+    """
+    entities = [resolve_reference(entity) for entity in entities]
+    by_model = {}
+    for entity in entities:
+      by_model.setdefault(entity.__class__, []).append(entity)
+    
+    for model, group in by_model.items():
+      for entity in group:
+        entity._check_complete()
+      
+      event = hooks.start('put_multi', model)
+      collection = model._collection()
+      created = [entity for entity in group if entity.key == None]
+      updated = [entity for entity in group if entity.key != None]
+      
+      for chunk in batched(created):
+        documents = [entity.packed() for entity in chunk]
+        saved = collection.insert_many(documents)
+        for entity, id, document in zip(chunk, saved.inserted_ids, documents):
+          entity._saved(id)
+          entity._remember(document)
+      
+      for chunk in batched(updated):
+        documents = [entity.packed() for entity in chunk]
+        requests = []
+        for entity, document in zip(chunk, documents):
+          if entity._document is None:
+            requests.append(ReplaceOne({ '_id': ObjectId(entity.key.id) }, document))
+            continue
+          update = entity._update(document)
+          if update:
+            requests.append(UpdateOne({ '_id': ObjectId(entity.key.id) }, update))
+        if requests:
+          collection.bulk_write(requests, ordered=False)
+        for entity, document in zip(chunk, documents):
+          entity._remember(document)
+      
+      if event: hooks.finish(event, payload=[entity.packed() for entity in group])
+    
+    return entities
+  
+  @classmethod
+  def ingest(cls, items, batch_size=BATCH_SIZE, max_batch_bytes=BATCH_BYTES, on_insert=None):
+    """
+    ' PURPOSE
+    '   Inserts a stream of new entities as fast as possible. Items are
+    '   validated and packed one at a time, then sent in unordered
+    '   insert_many batches bounded both by count and encoded size, so
+    '   a generator of millions of items never has to be held in memory
+    '   at once. A bad item is reported rather than failing its batch.
+    ' PARAMETERS
+    '   <iterable items> unsaved entities of this model, or dicts
+    '                    mapping property names to values
+    '   optional <int batch_size> the max documents per insert_many
+    '   optional <int max_batch_bytes> the max encoded size per batch
+    '   optional <function on_insert(int index, Key key)> called with
+    '                                                   the input index
+    '                                                   and key of every
+    '                                                   inserted item,
+    '                                                   one batch at a
+    '                                                   time
+    ' RETURNS
+    '   <dict report>
+    '     inserted ~ the amount of documents inserted
+    '     errors ~ list of (int index, Exception error) for every item
+    '              that failed validation (BadValueError,
+    '              ProjectionError, DanglingReferenceError), could not
+    '              be packed or encoded (TypeError, ValueError,
+    '              InvalidDocument, ex. a value BSON cannot represent)
+    '              or was rejected by the server (WriteError, ex. a
+    '              duplicate key)
+    ' NOTES
+    '   1. Ids are generated client side, so each document is encoded
+    '      exactly once and entity items are assigned their key.
+    '   2. Unlike save and put_multi, ingested entities are not held by
+    '      the active context nor written to the global cache; a long
+    '      running import would otherwise fill both.
+    '   3. Since batches are unordered, documents after a rejected one
+    '      are still inserted.
+    '   4. Memory stays bounded by the batch, plus one entry per failed
+    '      item. The keys of inserted items are not collected; pass
+    '      on_insert to receive them as they are written.
+    ' EXAMPLE USAGE
+    '   -> report = User.ingest({ 'email': row[0] } for row in rows)
+    '   -> for index, error in report['errors']: ...
+    """
+    report = { 'inserted': 0, 'errors': [] }
+    collection = cls._collection()
+    
+    # (input index, entity or None, packed document, encoded document)
+    # of every item in the pending batch
+    pending = []
+    pending_bytes = 0
+    
+    def flush():
+      event = hooks.start('ingest', cls)
+      failed = {}
+      try:
+        collection.insert_many([item[3] for item in pending], ordered=False)
+      except BulkWriteError as error:
+        for detail in error.details.get('writeErrors', []):
+          failed[detail['index']] = WriteError(detail.get('errmsg'), detail.get('code'), detail)
+      invalidate_queries(cls)
+      
+      for position, (index, entity, document, raw) in enumerate(pending):
+        if position in failed:
+          report['errors'].append((index, failed[position]))
+          continue
+        report['inserted'] += 1
+        if on_insert:
+          on_insert(index, Key(cls, str(document['_id'])))
+        if entity is not None:
+          entity._saved(document['_id'])
+          entity._document = _snapshot(document)
+      
+      if event:
+        event.bytes = pending_bytes
+        hooks.finish(event, documents=len(pending) - len(failed))
+      del pending[:]
+    
+    for index, item in enumerate(items):
+      try:
+        if isinstance(item, dict):
+          entity = None
+          unknown = [name for name in item if not name in cls.properties()]
+          if unknown:
+            raise BadValueError('%s has no properties %s' % (cls.__name__, unknown))
+          document = {}
+          for prop in cls.properties():
+            document[prop.name()] = prop._pack(item.get(prop.name()))
+        else:
+          entity = resolve_reference(item)
+          if not isinstance(entity, cls):
+            raise BadValueError('Expected %s entity or dict. Got %s' % (cls.__name__, entity))
+          if entity.key != None:
+            raise BadValueError('Entity has already been saved: %s' % entity.key)
+          entity._check_complete()
+          document = entity.packed()
+        document['_id'] = ObjectId()
+        raw = RawBSONDocument(bsonlib.encode(document))
+      except (BadValueError, ProjectionError, DanglingReferenceError, InvalidDocument, TypeError, ValueError, OverflowError) as error:
+        report['errors'].append((index, error))
+        continue
+      
+      if pending and (len(pending) >= batch_size or
+                      pending_bytes + len(raw.raw) > max_batch_bytes):
+        flush()
+        pending_bytes = 0
+      pending.append((index, entity, document, raw))
+      pending_bytes += len(raw.raw)
+    
+    if pending:
+      flush()
+    
+    report['errors'].sort(key=lambda error: error[0])
+    return report
+  
+  @property
   def kind(self):
-    return self.__class__
+    return self.__class__.__name__
   
   @classmethod
   def properties(cls):
@@ -192,8 +564,11 @@ class Model(object):
     '      Now this entity will be initialized with the properties for 'prop1'
     '      and 'float1' already filled in.
     """
-    for prop in self.properties():
-      setattr(self, prop.name(), None)
+    self._values = [None] * len(self._properties)
+    self._projection = None
+    # the packed document as last read from or written to the database.
+    # Used by save to only send the properties that changed.
+    self._document = None
     
     if key:
       self.key = key
@@ -204,9 +579,6 @@ class Model(object):
     
     self._load()
     
-    if self.key:
-      self.kind = self.__class__.__name__
-    
     for prop, value in kwargs.items():
       if prop in self.properties():
         setattr(self, prop, value)
@@ -222,14 +594,79 @@ class Model(object):
     ' RETURNS
     '   <dict data>
     """
-    json = {}
-    for prop in self.properties():
-      json[prop.name()] = prop._pack(getattr(self, prop.name()))
+    if self._projection:
+      # reading the missing properties raises UnprojectedPropertyError
+      json = {}
+      for prop in self.properties():
+        json[prop.name()] = prop._pack(getattr(self, prop.name()))
+    else:
+      json = self._codec.encode(self._values)
     if meta:
       json['key'] = self.key.serialize()
       json['id'] = self.key.id
     return json
   
+  @classmethod
+  def _from_document(cls, document, projection=None):
+    """
+    ' PURPOSE
+    '   Builds an entity straight from a document that has already
+    '   been read from the database (for example by a query cursor).
+    '   Unlike initializing via key, no additional round trip is made.
+    ' PARAMETERS
+    '   <dict document> a document including its '_id'
+    '   optional <list str projection> the property names present in
+    '                                  a partial document
+    ' RETURNS
+    '   <MyModel extends Model entity>
+    ' NOTES
+    '   1. When given a projection the entity is partial. Reading any
+    '      other property raises UnprojectedPropertyError and the entity
+    '      refuses to be saved.
+    '   2. The model's __init__ runs without arguments before the
+    '      document is applied, so entities are set up the same way
+    '      whether built here or by Key.get.
+    """
+    entity = cls()
+    entity.key = Key(cls, str(document['_id']))
+    if projection:
+      entity._values = [_UNLOADED] * len(cls._properties)
+      entity._projection = tuple(projection)
+      for name in projection:
+        setattr(entity, name, None)
+    entity._populate(document)
+    if projection:
+      # partial entities are never diffed, see _check_complete
+      entity._document = None
+    return entity
+  
+  def is_partial(self):
+    """
+    ' PURPOSE
+    '   Whether this entity was loaded by a projection query and so
+    '   only holds some of its properties.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <bool partial>
+    """
+    return bool(self._projection)
+  
+  def _check_complete(self):
+    """
+    ' PURPOSE
+    '   Guards writes against partial entities which would otherwise
+    '   overwrite unloaded properties with None.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   None
+    ' ERRORS
+    '   ProjectionError ~ if this entity is partial
+    """
+    if self._projection:
+      raise ProjectionError('Cannot save a partial entity loaded by a projection query: %s' % self.key)
+  
   def _load(self):
     """
     ' PURPOSE
@@ -242,16 +679,80 @@ class Model(object):
     """
     if not self.key: return
     
-    collection = self._collection()
-    entity = collection.find_one({'_id': ObjectId(self.key.id)})
-    if not entity:
-      raise ValueError('Entity does not exist')
+    cache = get_cache(self.__class__)
+    entity = cache.get(str(self.key.id)) if cache else None
+    
+    if entity is None:
+      filter = {'_id': ObjectId(self.key.id)}
+      event = hooks.start('get', self.__class__, filter)
+      collection = self._collection()
+      entity = collection.find_one(filter)
+      if event: hooks.finish(event, payload=[entity] if entity else [])
+      if not entity:
+        raise EntityNotFoundError('Entity does not exist')
+      if cache:
+        cache.set(str(self.key.id), entity)
+    
+    self._populate(entity)
+  
+  def _populate(self, document):
+    """
+    ' PURPOSE
+    '   A private method used to unpack a raw document's values onto
+    '   this entity's properties using the model's codec.
+    ' PARAMETERS
+    '   <dict document>
+    ' RETURNS
+    '   None
+    """
+    self._codec.decode(document, self._values)
+    self._document = _snapshot(document)
+  
+  def _update(self, document):
+    """
+    ' PURPOSE
+    '   Compares a freshly packed document with the document last read
+    '   or written and builds an update sending only what changed.
+    '   Comparing packed values (rather than watching assignments) also
+    '   catches in place changes such as appending to a multiple
+    '   property's list.
+    ' PARAMETERS
+    '   <dict document> the result of self.packed()
+    ' RETURNS
+    '   <dict update> with $set and/or $unset
+    '   None if nothing changed
+    ' NOTES
+    '   1. Properties packed to None are unset, which reads back the
+    '      same as a stored null.
+    """
+    stored = self._document
+    changed, removed = {}, {}
+    for name, value in document.items():
+      if value is None:
+        if stored.get(name) is not None:
+          removed[name] = ''
+      elif not name in stored or stored[name] != value:
+        changed[name] = value
     
-    reserved = ['_id']
-    for key, value in entity.items():
-      if not key in reserved:
-        prop = getattr(self.__class__, key)
-        setattr(self, key, prop._unpack(value))
+    update = {}
+    if changed: update['$set'] = changed
+    if removed: update['$unset'] = removed
+    return update or None
+  
+  def dirty_properties(self):
+    """
+    ' PURPOSE
+    '   Returns the names of the properties modified since this entity
+    '   was last loaded or saved.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <list str names> every property name for an unsaved entity
+    """
+    if self._document is None:
+      return list(self.properties().names())
+    update = self._update(self.packed()) or {}
+    return list(update.get('$set', {})) + list(update.get('$unset', {}))
   
   def save(self):
     """
@@ -264,20 +765,131 @@ class Model(object):
     ' NOTES
     '   1. New entities have no key value until this method
     '      has been executed successfuly.
+    '   2. Existing entities only send the properties that changed since
+    '      they were loaded ($set/$unset), leaving other fields written
+    '      concurrently untouched. Nothing is sent if nothing changed.
+    """
+    self._check_complete()
+    
+    document = self.packed()
+    write = self._write(document)
+    if write:
+      method, args, payload = write
+      event = hooks.start('save', self.__class__)
+      result = getattr(self._collection(), method)(*args)
+      if self.key == None:
+        self._saved(result.inserted_id)
+      if event: hooks.finish(event, payload=payload)
+    self._remember(document)
+    return self
+  
+  async def save_async(self):
+    """
+    ' PURPOSE
+    '   Awaitable counterpart of save using the async driver.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <MyModel extends Model entity>
+    """
+    self._check_complete()
+    
+    document = self.packed()
+    write = self._write(document)
+    if write:
+      method, args, payload = write
+      event = hooks.start('save', self.__class__)
+      result = await getattr(self._async_collection(), method)(*args)
+      if self.key == None:
+        self._saved(result.inserted_id)
+      if event: hooks.finish(event, payload=payload)
+    self._remember(document)
+    return self
+  
+  def _write(self, document):
+    """
+    ' PURPOSE
+    '   Decides the write that saves this entity, shared by save and
+    '   save_async.
+    ' PARAMETERS
+    '   <dict document> the packed entity
+    ' RETURNS
+    '   <tuple (str method, tuple args, list payload)> the collection
+    '   method and its arguments, and the documents sent for the hooks.
+    '   None if nothing changed since the entity was loaded.
     """
-    collection = self._collection()
     if self.key == None:
       # create new database entry
-      saved = collection.insert_one(self.packed())
-      id = saved.inserted_id
-      self.key = Key(self.__class__, id)
-      self.kind = self.key.model.__name__
-    else:
-      # update database entry
-      collection.replace_one({
-        '_id': ObjectId(self.key.id)
-      }, self.packed())
-    return self
+      return 'insert_one', (document,), [document]
+    
+    filter = { '_id': ObjectId(self.key.id) }
+    if self._document is None:
+      # update database entry whose previous state is unknown
+      return 'replace_one', (filter, document), [document]
+    
+    # update the changed properties of the database entry
+    update = self._update(document)
+    if update:
+      return 'update_one', (filter, update), [update]
+    return None
+  
+  def _saved(self, id):
+    """
+    ' PURPOSE
+    '   Assigns the key of a newly inserted entity.
+    ' PARAMETERS
+    '   <ObjectId id>
+    ' RETURNS
+    '   None
+    ' NOTES
+    '   1. Key ids are strings, as for keys of loaded entities.
+    """
+    self.key = Key(self.__class__, str(id))
+  
+  def _remember(self, document):
+    """
+    ' PURPOSE
+    '   Records the document just written as this entity's stored state
+    '   and holds the entity in the active context and its document in
+    '   the model's cache, if any, so later gets of its key are served
+    '   without a round trip. Also invalidates the kind's cached query
+    '   results.
+    ' PARAMETERS
+    '   <dict document> the packed document that was written
+    ' RETURNS
+    '   None
+    """
+    self._document = _snapshot(document)
+    invalidate_queries(self.__class__)
+    
+    context = get_context()
+    if context:
+      context.set(self.key, self)
+    
+    cache = get_cache(self.__class__)
+    if cache:
+      document['_id'] = ObjectId(self.key.id)
+      cache.set(str(self.key.id), document)
+  
+  @classmethod
+  def _forget(cls, key):
+    """
+    ' PURPOSE
+    '   Drops a deleted entity from the active context and the model's
+    '   cache, if any. Called once the delete has been written, see
+    '   _remember.
+    ' PARAMETERS
+    '   <Key key>
+    ' RETURNS
+    '   None
+    """
+    context = get_context()
+    if context:
+      context.evict(key)
+    
+    cache = get_cache(cls)
+    if cache:
+      cache.evict(str(key.id))
   
   def delete(self):
     """
@@ -290,6 +902,36 @@ class Model(object):
     """
     self.key.delete()
   
+  async def delete_async(self):
+    """
+    ' PURPOSE
+    '   Awaitable counterpart of delete using the async driver.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   Nothing
+    """
+    await self.key.delete_async()
+  
+  def __copy__(self):
+    """
+    ' PURPOSE
+    '   Shallow copies an entity. The copy gets its own values list so
+    '   that setting a property on one does not change the other.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <MyModel extends Model entity>
+    """
+    entity = self.__class__.__new__(self.__class__)
+    entity.key = self.key
+    entity._values = list(self._values)
+    entity._document = self._document
+    entity._projection = self._projection
+    if hasattr(self, '__dict__'):
+      entity.__dict__.update(self.__dict__)
+    return entity
+  
   def __repr__(self):
     """
     ' see self.__str__
@@ -308,6 +950,9 @@ class Model(object):
     props = list(self.properties().names()) + ['key']
     formatted = []
     
+    if self._projection:
+      props = list(self._projection) + ['key']
+    
     for name in props:
       val = getattr(self, name)
       if not val is None:
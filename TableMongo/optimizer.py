@@ -0,0 +1,199 @@
+"""
+' PURPOSE
+'   Simplifies the filters compiled by AND, OR and NOT before they are
+'   sent to the server. The logic operators compile one clause per
+'   comparison, wrapped in as many $and/$or documents as they were
+'   nested, which hides from the query planner that, for example,
+'   'age > 18 AND age < 25' is a single range on one index. Every
+'   rewrite below matches exactly the same documents.
+'
+'   1. Nested $and are flattened and single clause $and/$or unwrapped.
+'   2. Clauses of an AND on the same field are merged into one
+'      condition: {age: {$gt: 18}}, {age: {$lt: 25}} becomes
+'      {age: {$gt: 18, $lt: 25}}.
+'   3. Equalities on one field within an OR become a single $in:
+'      {$or: [{a: {$eq: 1}}, {a: {$eq: 2}}]} becomes {a: {$in: [1, 2]}}.
+'   4. Single value $in clauses on one field within an AND (how
+'      multiple properties compile ==) become a single $all:
+'      {tags: {$in: ['a']}}, {tags: {$in: ['b']}} becomes
+'      {tags: {$all: ['a', 'b']}}.
+"""
+
+
+""" GLOBAL IMPORTS """
+import re
+
+
+""" MONGO IMPORTS """
+from bson.regex import Regex
+
+
+def optimize(bson):
+  """
+  ' PURPOSE
+  '   Returns a simplified filter matching the same documents.
+  ' PARAMETERS
+  '   <dict bson> a compiled filter, ex. LogicOperator.bson()
+  ' RETURNS
+  '   <dict bson>
+  ' NOTES
+  '   1. The given filter is never modified; logic operators memoize
+  '      their compiled filter.
+  """
+  return _merge(_and_clauses(bson))
+
+
+def _is_operators(condition):
+  return isinstance(condition, dict) and len(condition) > 0 and all(key.startswith('$') for key in condition)
+
+
+def _and_clauses(bson):
+  """
+  ' PURPOSE
+  '   Flattens a filter into the list of its AND'd clauses, each a
+  '   single key document.
+  ' PARAMETERS
+  '   <dict bson>
+  ' RETURNS
+  '   <list dict clauses>
+  """
+  clauses = []
+  for key, condition in bson.items():
+    if key == '$and':
+      for clause in condition:
+        clauses.extend(_and_clauses(clause))
+    elif key == '$or':
+      optimized = _or(condition)
+      if list(optimized) == ['$or']:
+        clauses.append(optimized)
+      else:
+        clauses.extend(_and_clauses(optimized))
+    elif key == '$nor':
+      clauses.append({ key: [optimize(clause) for clause in condition] })
+    else:
+      clauses.append({ key: condition })
+  return clauses
+
+
+def _equality(clause):
+  """
+  ' PURPOSE
+  '   Returns the field and values of a clause that only tests a field
+  '   for equality with one or more values.
+  ' PARAMETERS
+  '   <dict clause>
+  ' RETURNS
+  '   <tuple(str field, list values)> or None
+  """
+  if len(clause) != 1:
+    return None
+  field, condition = list(clause.items())[0]
+  if field.startswith('$'):
+    return None
+
+  if _is_operators(condition):
+    if len(condition) != 1:
+      return None
+    operator, value = list(condition.items())[0]
+    if operator == '$in' and isinstance(value, list):
+      values = value
+    elif operator == '$eq':
+      values = [value]
+    else:
+      return None
+  elif isinstance(condition, dict):
+    # an embedded document, matched as a whole
+    values = [condition]
+  else:
+    values = [condition]
+
+  # a regular expression matches differently within $in
+  if any(isinstance(value, (Regex, re.Pattern)) for value in values):
+    return None
+  return field, values
+
+
+def _or(branches):
+  """
+  ' PURPOSE
+  '   Optimizes the branches of an $or.
+  ' PARAMETERS
+  '   <list dict branches>
+  ' RETURNS
+  '   <dict bson>
+  """
+  optimized = []
+  for branch in branches:
+    branch = optimize(branch)
+    if not branch:
+      # an empty branch matches every document and so does the $or
+      return {}
+    if list(branch) == ['$or']:
+      optimized.extend(branch['$or'])
+    else:
+      optimized.append(branch)
+
+  merged, positions, originals = [], {}, {}
+  for branch in optimized:
+    equality = _equality(branch)
+    if equality is None:
+      merged.append(branch)
+      continue
+    field, values = equality
+    if field in positions:
+      merged[positions[field]][field]['$in'].extend(values)
+    else:
+      positions[field] = len(merged)
+      originals[field] = branch
+      merged.append({ field: { '$in': list(values) } })
+
+  # leave lone equalities as they were written
+  for field, position in positions.items():
+    if merged[position][field]['$in'] == list(_equality(originals[field])[1]):
+      merged[position] = originals[field]
+
+  if len(merged) == 1:
+    return merged[0]
+  return { '$or': merged }
+
+
+def _merge(clauses):
+  """
+  ' PURPOSE
+  '   Merges AND'd clauses into as few documents as possible.
+  ' PARAMETERS
+  '   <list dict clauses> single key documents
+  ' RETURNS
+  '   <dict bson>
+  """
+  # single value $in clauses on one field become $all
+  contained = {}
+  for clause in clauses:
+    field, condition = list(clause.items())[0]
+    if (not field.startswith('$') and _is_operators(condition) and list(condition) == ['$in'] and
+        isinstance(condition['$in'], list) and len(condition['$in']) == 1):
+      contained.setdefault(field, []).append(clause)
+
+  for field, group in contained.items():
+    if len(group) < 2:
+      continue
+    position = [index for index, clause in enumerate(clauses) if clause is group[0]][0]
+    remaining = [clause for clause in clauses if not any(clause is other for other in group)]
+    remaining.insert(position, { field: { '$all': [clause[field]['$in'][0] for clause in group] } })
+    clauses = remaining
+
+  merged, leftovers = {}, []
+  for clause in clauses:
+    field, condition = list(clause.items())[0]
+    if not field in merged:
+      merged[field] = dict(condition) if _is_operators(condition) else condition
+    elif (_is_operators(condition) and _is_operators(merged[field]) and
+          not set(condition) & set(merged[field])):
+      merged[field].update(condition)
+    else:
+      # ex. two lower bounds, or two $or
+      leftovers.append(clause)
+
+  if leftovers:
+    merged['$and'] = leftovers
+  return merged
@@ -1,13 +1,20 @@
+""" GLOBAL IMPORTS """
+import copy
+
+
 class PropertyList(tuple):
   
+  def __new__(cls, props=()):
+    self = super(PropertyList, cls).__new__(cls, props)
+    self._names = tuple([prop.name() for prop in self])
+    self._lookup = frozenset(self._names)
+    return self
+  
   def names(self):
-    return tuple([prop.name() for prop in self])
+    return self._names
   
   def __contains__(self, value):
-    for prop in self:
-      if prop.name() == value:
-        return True
-    return False
+    return value in self._lookup
 
 
 class PropertyQuery(object):
@@ -100,12 +107,47 @@ class SortDescriptor(object):
     """
     self.property = prop
     self.direction = direction
+  
+  def __repr__(self):
+    """
+    ' see self.__str__
+    """
+    return self.__str__()
+  
+  def __str__(self):
+    """
+    ' PURPOSE
+    '   Condensed, unique representation of the SortDescriptor data.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <str str_value>
+    """
+    sign = '-' if self.direction == self.DESCENDING else '+'
+    return '%s%s' % (sign, self.property)
 
 
 class BadValueError(Exception):
   pass
 
 
+class ProjectionError(Exception):
+  pass
+
+
+class UnprojectedPropertyError(ProjectionError, AttributeError):
+  pass
+
+
+class DanglingReferenceError(AttributeError):
+  pass
+
+
+# the value held by partial entities for properties their projection
+# query did not load
+_UNLOADED = object()
+
+
 """
 ' WARNING: DO NOT USE THIS CLASS AS A MODEL PROPERTY
 """
@@ -118,6 +160,11 @@ class Property(object):
   '   how to unpack the same data.
   """
   
+  # whether pack and unpack return their value unchanged, letting the
+  # model codecs skip this property for values of exactly its type
+  # (see Codec).
+  _identity = False
+  
   @staticmethod
   def type():
     return None
@@ -137,17 +184,29 @@ class Property(object):
   def is_required(self):
     return self._required
   
-  def _load_meta(self, kind=None, name=None):
+  def is_indexed(self):
+    return self._indexed
+  
+  def is_unique(self):
+    return self._unique
+  
+  def _load_meta(self, kind=None, name=None, position=None):
     self._kind = kind
     self._name = name
+    # where entities of the kind hold this property's value, see
+    # Model._values
+    self._position = position
   
-  def __init__(self, multiple=False, default=None, required=False):
+  def __init__(self, multiple=False, default=None, required=False, indexed=False, unique=False):
     if not default is None and required:
       raise ValueError('A property cannot have a default value and be required')
     
     self._multiple = multiple
     self._default = default
     self._required = required
+    # a unique property is always indexed
+    self._indexed = indexed or unique
+    self._unique = unique
   
   def _pack(self, value):
     """
@@ -238,6 +297,41 @@ class Property(object):
     """
     raise NotImplementedError()
   
+  def __get__(self, entity, kind=None):
+    """
+    ' PURPOSE
+    '   Reads this property's value from an entity's values list.
+    '   Class level access returns the property.
+    ' PARAMETERS
+    '   <Model entity>
+    '   optional <class MyModel extends Model kind>
+    ' RETURNS
+    '   <Property prop> if accessed on the class
+    '   <object value> if accessed on an entity
+    ' ERRORS
+    '   UnprojectedPropertyError ~ if the entity is partial and this
+    '                              property was not loaded by its
+    '                              projection query
+    """
+    if entity is None:
+      return self
+    value = entity._values[self._position]
+    if value is _UNLOADED:
+      raise UnprojectedPropertyError('%s was not loaded by the projection query' % self)
+    return value
+  
+  def __set__(self, entity, value):
+    """
+    ' PURPOSE
+    '   Stores this property's value in an entity's values list.
+    ' PARAMETERS
+    '   <Model entity>
+    '   <object value>
+    ' RETURNS
+    '   Nothing
+    """
+    entity._values[self._position] = value
+  
   def __hash__(self):
     """
     ' PURPOSE
@@ -326,6 +420,8 @@ class Property(object):
 
 class BooleanProperty(Property):
   
+  _identity = True
+  
   @staticmethod
   def type():
     return bool
@@ -339,6 +435,8 @@ class BooleanProperty(Property):
 
 class StringProperty(Property):
   
+  _identity = True
+  
   @staticmethod
   def type():
     return str
@@ -413,7 +511,128 @@ class ModelProperty(KeyProperty):
     self._type = model
   
   def unpack(self, value):
-    return super(ModelProperty, self).unpack(value).get()
+    return ModelReference(super(ModelProperty, self).unpack(value))
   
   def pack(self, value):
     return super(ModelProperty, self).pack(value.key)
+
+
+class ModelReference(object):
+  """
+  ' PURPOSE
+  '   The value of a loaded ModelProperty. Stands in for the referenced
+  '   entity, which is only fetched the first time one of its
+  '   attributes is used. Hence loading an entity never costs an
+  '   additional round trip per reference.
+  '
+  ' EXAMPLE USAGE
+  '   -> trip.author.key     # no round trip
+  '   -> trip.author.email   # fetches the author on first access
+  '   -> Trip.query().fetch(prefetch=[Trip.author])  # one $in for all authors
+  '
+  ' NOTES
+  '   1. isinstance(trip.author, User) holds without fetching.
+  '   2. Using an attribute of a reference whose entity was deleted
+  '      raises DanglingReferenceError.
+  '   3. Copies and pickles hold only the key; a deep copy or an
+  '      unpickled reference fetches its entity again on first use.
+  '   4. References are equal (and hash alike) when they hold the same
+  '      key. A reference never equals an entity, which hashes by
+  '      identity; compare trip.author.key == user.key instead.
+  """
+  
+  __slots__ = ('key', '_entity', '_resolved')
+  
+  def __init__(self, key):
+    object.__setattr__(self, 'key', key)
+    object.__setattr__(self, '_entity', None)
+    object.__setattr__(self, '_resolved', False)
+  
+  @property
+  def __class__(self):
+    return self.key.model
+  
+  def is_resolved(self):
+    return self._resolved
+  
+  def _resolve(self, entity):
+    object.__setattr__(self, '_entity', entity)
+    object.__setattr__(self, '_resolved', True)
+  
+  def get(self):
+    """
+    ' PURPOSE
+    '   Returns the referenced entity, fetching it on first use.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <MyModel extends Model entity>
+    '   None if the entity does not exist.
+    """
+    if not self._resolved:
+      self._resolve(self.key.get())
+    return self._entity
+  
+  def _get_existing(self):
+    entity = self.get()
+    if entity is None:
+      raise DanglingReferenceError('Referenced entity does not exist: %s' % self.key)
+    return entity
+  
+  def __getattr__(self, name):
+    # private and special names are never forwarded. copy and pickle
+    # look them up on instances whose slots may not be set yet, where
+    # resolving would recurse forever.
+    if name.startswith('_') or name in ModelReference.__slots__:
+      raise AttributeError(name)
+    return getattr(self._get_existing(), name)
+  
+  def __setattr__(self, name, value):
+    setattr(self._get_existing(), name, value)
+  
+  def __eq__(self, other):
+    if type(other) is not ModelReference:
+      return NotImplemented
+    return self.key == other.key
+  
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+  
+  def __hash__(self):
+    return hash(self.key)
+  
+  def __reduce__(self):
+    # __class__ is overridden, so the default reduce would rebuild the
+    # referenced model instead of a reference
+    return (ModelReference, (self.key,))
+  
+  def __copy__(self):
+    reference = ModelReference(self.key)
+    if self._resolved:
+      reference._resolve(self._entity)
+    return reference
+  
+  def __deepcopy__(self, memo):
+    return ModelReference(copy.deepcopy(self.key, memo))
+  
+  def __repr__(self):
+    return 'ModelReference(%s)' % self.key
+
+
+def resolve_reference(entity):
+  """
+  ' PURPOSE
+  '   Returns the entity a ModelReference stands for, fetching it if
+  '   needed, or the given entity itself. Entry points taking entities
+  '   call this since a reference never forwards private attributes.
+  ' PARAMETERS
+  '   <MyModel extends Model entity> or <ModelReference reference>
+  ' RETURNS
+  '   <MyModel extends Model entity>
+  ' RAISES
+  '   DanglingReferenceError if the referenced entity does not exist
+  """
+  if type(entity) is ModelReference:
+    return entity._get_existing()
+  return entity
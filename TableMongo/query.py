@@ -1,7 +1,19 @@
 """ LOCAL IMPORTS """
-from .properties import Property, PropertyQuery, SortDescriptor
+from .properties import Property, PropertyQuery, SortDescriptor, ModelProperty, ModelReference, UnprojectedPropertyError
 from .key import Key
+from .context import get_context
+from .cache import get_query_cache, get_generation, get_count_cache
+from . import advisor
+from . import optimizer
+from .codec import _Never
+from .aggregation import Grouping, Count, Sum
+from . import hooks
 import pymongo
+import base64
+import queue
+import threading
+import time
+import bson as bsonlib
 
 
 class InvalidSortDescriptor(Exception):
@@ -11,6 +23,227 @@ class InvalidSortDescriptor(Exception):
 # TODO once used the query iterator is done
 
 
+def _batches(cursor, batch_size):
+  """
+  ' PURPOSE
+  '   Groups the documents streamed by a cursor into lists.
+  ' PARAMETERS
+  '   <Cursor cursor>
+  '   <int batch_size>
+  ' RETURNS
+  '   <generator list dict batch>
+  """
+  batch = []
+  for document in cursor:
+    batch.append(document)
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def _freeze(value):
+  """
+  ' PURPOSE
+  '   Converts a compiled filter into a hashable value that is the same
+  '   for equivalent filters whatever the order of their dict keys and
+  '   logical clauses.
+  ' PARAMETERS
+  '   <object value>
+  ' RETURNS
+  '   <object frozen>
+  """
+  if isinstance(value, dict):
+    frozen = []
+    for key, item in value.items():
+      if key in ('$and', '$or', '$nor'):
+        # the order of these clauses does not change the matches
+        frozen.append((key, ('clauses',) + tuple(sorted((_freeze(clause) for clause in item), key=repr))))
+      else:
+        frozen.append((key, _freeze(item)))
+    return tuple(sorted(frozen))
+  if isinstance(value, (list, tuple)):
+    return ('list',) + tuple(_freeze(item) for item in value)
+  try:
+    hash(value)
+  except TypeError:
+    return repr(value)
+  return value
+
+
+class _Failure(object):
+  
+  def __init__(self, error):
+    self.error = error
+
+
+_DONE = object()
+
+
+def _read_ahead(cursor, batch_size):
+  """
+  ' PURPOSE
+  '   Like _batches but reads the next batch from the server on a
+  '   background thread while the caller processes the current one.
+  '   At most three batches are held at once: the caller's, one ready
+  '   and one being read.
+  ' PARAMETERS
+  '   <Cursor cursor>
+  '   <int batch_size>
+  ' RETURNS
+  '   <generator list dict batch>
+  ' NOTES
+  '   1. Only the background thread touches the cursor. When the caller
+  '      stops early the thread finishes its current read, closes the
+  '      cursor and exits.
+  '   2. Errors raised while reading are raised to the caller.
+  """
+  ready = queue.Queue(maxsize=1)
+  stopped = threading.Event()
+  
+  def offer(item):
+    while not stopped.is_set():
+      try:
+        ready.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        continue
+    return False
+  
+  def read():
+    try:
+      for batch in _batches(cursor, batch_size):
+        if not offer(batch):
+          return
+      offer(_DONE)
+    except Exception as error:
+      offer(_Failure(error))
+    finally:
+      cursor.close()
+  
+  thread = threading.Thread(target=read, name='TableMongo-read-ahead')
+  thread.daemon = True
+  thread.start()
+  try:
+    while True:
+      item = ready.get()
+      if item is _DONE:
+        return
+      if isinstance(item, _Failure):
+        raise item.error
+      yield item
+  finally:
+    stopped.set()
+
+
+def _timed(batches, event):
+  """
+  ' PURPOSE
+  '   Passes through the batches of a streamed query and finishes its
+  '   hook event once the stream ends or is closed early, so queries
+  '   whose consumer stops iterating are still reported.
+  ' PARAMETERS
+  '   <generator list batches> see _batches and _read_ahead
+  '   <Event event> or None
+  ' RETURNS
+  '   <generator list batch>
+  ' NOTES
+  '   1. The event's duration only counts the time spent waiting for
+  '      batches, not the time the caller spends between them.
+  '   2. A stream failing with an error is not reported, as for any
+  '      other failed operation.
+  """
+  documents, reading, failed = 0, 0.0, False
+  try:
+    while True:
+      started = time.perf_counter()
+      try:
+        batch = next(batches)
+      except StopIteration:
+        return
+      finally:
+        reading += time.perf_counter() - started
+      documents += len(batch)
+      yield batch
+  except Exception:
+    failed = True
+    raise
+  finally:
+    batches.close()
+    if event and not failed:
+      hooks.finish(event, documents=documents, duration=reading)
+
+
+class Cursor(object):
+  """
+  ' PURPOSE
+  '   An opaque position within an ordered query. Holds the sort
+  '   values (including '_id') of the last entity on a page so that
+  '   the next page can be resumed with a range predicate instead of
+  '   skipping over every previous result.
+  '
+  ' EXAMPLE USAGE
+  '   -> users, cursor, more = User.query().order(-User.age).fetch_page(20)
+  '   -> token = cursor.urlsafe()
+  '   ...
+  '   -> users, cursor, more = User.query().order(-User.age).fetch_page(20, Cursor(urlsafe=token))
+  """
+  
+  def __init__(self, fields=None, values=None, urlsafe=None):
+    """
+    ' PURPOSE
+    '   Instantiates a new Cursor via either its urlsafe representation
+    '   or the sorted field names and their values.
+    ' PARAMETERS
+    '   optional <list str fields>
+    '   optional <list object values>
+    '   optional <str urlsafe>
+    ' RETURNS
+    '   <Cursor cursor>
+    """
+    if urlsafe:
+      try:
+        decoded = bsonlib.decode(base64.urlsafe_b64decode(urlsafe.encode('utf-8')))
+        fields, values = decoded['f'], decoded['v']
+      except:
+        raise ValueError('Malformed urlsafe cursor')
+    elif fields is None or values is None:
+      raise ValueError('Expected fields and values or urlsafe')
+    self.fields = list(fields)
+    self.values = list(values)
+  
+  def urlsafe(self):
+    """
+    ' PURPOSE
+    '   Returns a urlsafe version of this cursor (base64 of its BSON).
+    '   Can be used to instantiate a clone of this cursor.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <str urlsafe>
+    """
+    encoded = base64.urlsafe_b64encode(bsonlib.encode({ 'f': self.fields, 'v': self.values }))
+    return encoded.decode('utf-8')
+  
+  def __repr__(self):
+    """
+    ' see self.__str__
+    """
+    return self.__str__()
+  
+  def __str__(self):
+    """
+    ' PURPOSE
+    '   Condensed, unique representation of the Cursor data.
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <str str_value>
+    """
+    return 'Cursor(\'%s\')' % self.urlsafe()
+
+
 class Query(object):
   """
   ' PURPOSE
@@ -19,7 +252,12 @@ class Query(object):
   '   actions that don't load memory until needed.
   """
   
-  def __init__(self, model, logic_chain):
+  SORT_DIRECTIONS = {
+    SortDescriptor.ASCENDING: pymongo.ASCENDING,
+    SortDescriptor.DESCENDING: pymongo.DESCENDING
+  }
+  
+  def __init__(self, model, logic_chain, sort_descriptors=()):
     """
     ' PURPOSE
     '   Construct the class with the given model and query
@@ -27,27 +265,161 @@ class Query(object):
     ' PARAMETERS
     '   <Model model>
     '   <LogicOperator logic_chain>
+    '   optional <tuple SortDescriptor sort_descriptors>
     ' RETURNS
     '   <Query query>
     """
     self._model = model
     self._logic_chain = logic_chain
-    self._query = self._query()
+    self._sort_descriptors = tuple(sort_descriptors)
+    self._compiled = None
   
-  def _query(self):
+  def _filter(self):
     """
     ' PURPOSE
-    '   Loads a pymongo cursor based on the given logic chain's bson.
+    '   Compiles this query's logic chain into the filter sent to the
+    '   server, simplified by the optimizer. see optimizer.optimize
+    ' PARAMETERS
+    '   None
+    ' RETURNS
+    '   <dict bson>
+    ' NOTES
+    '   1. Caches the result (memoize)
+    """
+    if self._compiled is None:
+      self._compiled = optimizer.optimize(self._logic_chain.bson())
+    return self._compiled
+  
+  def _sort(self):
+    """
+    ' PURPOSE
+    '   Converts this query's sort descriptors into a pymongo
+    '   compatible sort specification.
     ' PARAMETERS
     '   None
     ' RETURNS
+    '   <list tuple(str name, int direction) sort>
+    """
+    return [(descriptor.property.name(), self.SORT_DIRECTIONS[descriptor.direction])
+            for descriptor in self._sort_descriptors]
+  
+  def _query(self, keys_only=False, projection=None, collection=None):
+    """
+    ' PURPOSE
+    '   Loads a pymongo cursor based on the given logic chain's bson.
+    '   Unless keys_only is set the cursor streams full documents (or
+    '   the projected fields) so that entities can be built without
+    '   further round trips.
+    ' PARAMETERS
+    '   optional <bool keys_only>
+    '   optional <list Property projection>
+    '   optional <Collection collection> defaults to the model's sync
+    '                                    collection. The async collection
+    '                                    yields an async cursor.
+    ' RETURNS
     '   <Iterator cursor>
     """
-    collection = self._model._collection()
-    bson = self._logic_chain.bson()
-    cursor = collection.find(bson, projection={ '_id':1 })
+    if collection is None:
+      collection = self._model._collection()
+    bson = self._filter()
+    if keys_only:
+      cursor = collection.find(bson, projection={ '_id':1 })
+    elif projection:
+      cursor = collection.find(bson, projection=self._projection(projection))
+    else:
+      cursor = collection.find(bson)
+    if self._sort_descriptors:
+      cursor = cursor.sort(self._sort())
     return cursor
   
+  def _advise(self, cursor, bson=None, sort=None):
+    """
+    ' PURPOSE
+    '   Hands a cursor that is about to run to the index advisor when
+    '   it is enabled. see advisor.enable_index_advisor
+    ' PARAMETERS
+    '   <Cursor cursor>
+    '   optional <dict bson> defaults to this query's filter
+    '   optional <list sort> defaults to this query's sort
+    ' RETURNS
+    '   <Cursor cursor>
+    """
+    if advisor.is_enabled():
+      if bson is None: bson = self._filter()
+      if sort is None: sort = self._sort()
+      advisor.check(self._model, bson, sort, cursor)
+    return cursor
+  
+  def explain(self, count=0, offset=0, keys_only=False, projection=None):
+    """
+    ' PURPOSE
+    '   Explains how the server executes this query, as fetched with
+    '   the same arguments.
+    ' PARAMETERS
+    '   see self.fetch
+    ' RETURNS
+    '   <dict summary> the winning plan, whether it used an index,
+    '                  whether it scanned the collection or sorted in
+    '                  memory, documents and keys examined versus the
+    '                  documents returned, and a suggested index when
+    '                  the plan scans the collection or sorts in memory.
+    '                  see advisor.summarize
+    """
+    cursor = self._query(keys_only, projection).skip(offset).limit(count)
+    summary = advisor.summarize(cursor.explain())
+    summary['suggested_index'] = None
+    if summary['collection_scan'] or summary['in_memory_sort']:
+      summary['suggested_index'] = advisor.suggest_index(self._filter(), self._sort()) or None
+    return summary
+  
+  def _projection(self, projection):
+    """
+    ' PURPOSE
+    '   Converts a list of properties into a pymongo projection.
+    ' PARAMETERS
+    '   <list Property projection>
+    ' RETURNS
+    '   <dict projection>
+    """
+    fields = { '_id': 1 }
+    for prop in projection:
+      if not isinstance(prop, Property) or not prop.name() in self._model.properties():
+        raise ValueError('Expected a property of %s. Instead got: %s' % (self._model.__name__, prop))
+      fields[prop.name()] = 1
+    return fields
+  
+  def _hydrate(self, document, keys_only=False, projection=None):
+    """
+    ' PURPOSE
+    '   Converts a document streamed by the cursor into either a key,
+    '   a partial entity or a fully loaded entity.
+    ' PARAMETERS
+    '   <dict document>
+    '   optional <bool keys_only>
+    '   optional <list Property projection>
+    ' RETURNS
+    '   <Key key> if keys_only
+    '   <Model model> if not keys_only
+    ' NOTES
+    '   1. Fully loaded entities already held by the active Context are
+    '      returned as held, keeping any unsaved changes. Others are
+    '      added to it.
+    """
+    if keys_only:
+      return Key(self._model, str(document['_id']))
+    if projection:
+      return self._model._from_document(document, [prop.name() for prop in projection])
+    
+    context = get_context()
+    if context:
+      held = context.get(Key(self._model, str(document['_id'])))
+      if held is not None:
+        return held
+    entity = self._model._from_document(document)
+    if context:
+      context.set(entity.key, entity)
+    return entity
+  
   def filter(self, *args):
     """
     ' PURPOSE
@@ -61,62 +433,380 @@ class Query(object):
     ' RETURNS
     '   <Query query>
     """
-    new_login_chain = AND(self.logic_chain, *args)
-    return Query(self._model, new_login_chain)
+    new_login_chain = AND(self._logic_chain, *args)
+    return Query(self._model, new_login_chain, self._sort_descriptors)
+  
+  def _prefetch(self, entities, prefetch):
+    """
+    ' PURPOSE
+    '   Resolves the references held by the given ModelProperties of
+    '   every entity using one $in lookup per referenced kind (see
+    '   Key.get_multi) rather than a round trip per reference.
+    ' PARAMETERS
+    '   <list Model entities>
+    '   <list ModelProperty prefetch>
+    ' RETURNS
+    '   Nothing
+    """
+    for prop in prefetch:
+      if not isinstance(prop, ModelProperty) or not prop.name() in self._model.properties():
+        raise ValueError('Expected a ModelProperty of %s. Instead got: %s' % (self._model.__name__, prop))
+    
+    references = []
+    for entity in entities:
+      for prop in prefetch:
+        try:
+          value = getattr(entity, prop.name())
+        except UnprojectedPropertyError:
+          continue
+        for reference in ((value or []) if prop.is_multiple() else [value]):
+          if isinstance(reference, ModelReference) and not reference.is_resolved():
+            references.append(reference)
+    if not references:
+      return
+    
+    keys = list(set(reference.key for reference in references))
+    found = dict(zip(keys, Key.get_multi(keys)))
+    for reference in references:
+      reference._resolve(found[reference.key])
   
-  def fetch(self, count=0, offset=0, keys_only=False):
+  def _cached(self, *options):
+    """
+    ' PURPOSE
+    '   Looks up the model's query result cache. see Model._query_cache
+    ' PARAMETERS
+    '   *options anything besides the filter and sort that changes the
+    '            results, ex. the limit
+    ' RETURNS
+    '   <tuple(LRUCache cache, tuple cache_key, list documents)>
+    '   cache is None if the model does not cache queries, documents
+    '   is None on a miss
+    ' NOTES
+    '   1. The model's write generation is part of the key and must be
+    '      read before the query is sent. see cache.invalidate_queries
+    """
+    cache = get_query_cache(self._model)
+    if cache is None:
+      return None, None, None
+    cache_key = (get_generation(self._model), _freeze(self._filter()), tuple(self._sort())) + options
+    return cache, cache_key, cache.get(cache_key)
+  
+  def fetch(self, count=0, offset=0, keys_only=False, projection=None, prefetch=None):
     """
     ' PURPOSE
     '   Returns a subsection of the queried models.
     ' PARAMETERS
     '   <int offset>
-    '   <int count>
+    '   <int count> 0 means no limit
     '   <bool keys_only>
+    '   optional <list Property projection> only load these properties.
+    '                                       see Model._from_document
+    '   optional <list ModelProperty prefetch> resolve these references
+    '                                          of every result up front.
+    '                                          see self._prefetch
+    ' RETURNS
+    '   <list Key key> if keys_only
+    '   <list Model model> if not keys_only
+    ' NOTES
+    '   1. When the query is ordered the count is pushed down with the
+    '      sort so the server performs a top-k sort (or walks an index)
+    '      rather than sorting the whole match set.
+    '   2. Models with _query_cache enabled serve repeated fetches from
+    '      memory until the kind is next written to.
+    """
+    names = tuple(prop.name() for prop in projection) if projection else None
+    cache, cache_key, documents = self._cached('fetch', count, offset, keys_only, names)
+    if documents is None:
+      event = hooks.start('query', self._model, self._filter())
+      subsection = self._query(keys_only, projection).skip(offset).limit(count)
+      self._advise(subsection)
+      documents = list(subsection)
+      if event: hooks.finish(event, documents=len(documents))
+      if cache: cache.set(cache_key, documents)
+    results = [self._hydrate(document, keys_only, projection) for document in documents]
+    if prefetch and not keys_only:
+      self._prefetch(results, prefetch)
+    return results
+  
+  async def fetch_async(self, count=0, offset=0, keys_only=False, projection=None):
+    """
+    ' PURPOSE
+    '   Awaitable counterpart of fetch using the async driver.
+    ' PARAMETERS
+    '   see self.fetch
     ' RETURNS
     '   <list Key key> if keys_only
     '   <list Model model> if not keys_only
     """
-    subsection = self._query[offset:offset+count]
+    names = tuple(prop.name() for prop in projection) if projection else None
+    cache, cache_key, documents = self._cached('fetch', count, offset, keys_only, names)
+    if documents is None:
+      event = hooks.start('query', self._model, self._filter())
+      collection = self._model._async_collection()
+      subsection = self._query(keys_only, projection, collection).skip(offset).limit(count)
+      documents = [document async for document in subsection]
+      if event: hooks.finish(event, documents=len(documents))
+      if cache: cache.set(cache_key, documents)
+    return [self._hydrate(document, keys_only, projection) for document in documents]
+  
+  def fetch_page(self, page_size, start_cursor=None, keys_only=False, projection=None, prefetch=None):
+    """
+    ' PURPOSE
+    '   Returns a page of the queried models along with a cursor that
+    '   resumes right after it. Pages are located with a range
+    '   predicate on the sort values rather than skip(), so every page
+    '   costs the same no matter how deep it is.
+    ' PARAMETERS
+    '   <int page_size>
+    '   optional <Cursor start_cursor> a cursor returned by a previous page
+    '   optional <bool keys_only>
+    '   optional <list Property projection> only load these properties
+    '   optional <list ModelProperty prefetch> see self.fetch
+    ' RETURNS
+    '   <tuple(list results, Cursor next_cursor, bool more)>
+    ' NOTES
+    '   1. Results are ordered by this query's orders followed by '_id'
+    '      which breaks ties and makes every position unique.
+    '   2. Ordering by a multiple property is not supported since each
+    '      entity has no single sort value.
+    """
+    sort = self._sort()
+    if not '_id' in [field for field, direction in sort]:
+      sort.append(('_id', pymongo.ASCENDING))
+    fields = [field for field, direction in sort]
+    
+    bson = self._filter()
+    if start_cursor:
+      if start_cursor.fields != fields:
+        raise ValueError('Cursor does not match the ordering of this query')
+      resume = self._resume_bson(sort, start_cursor.values)
+      bson = optimizer.optimize({ '$and': [bson, resume] })
+    
+    fetched = None
     if keys_only:
-      return [Key(self._model, str(document['_id'])) for document in subsection]
-    return [Key(self._model, str(document['_id'])).get() for document in subsection]
+      fetched = dict((field, 1) for field in fields)
+    elif projection:
+      fetched = self._projection(projection)
+      fetched.update((field, 1) for field in fields)
+    
+    event = hooks.start('query', self._model, bson)
+    collection = self._model._collection()
+    cursor = collection.find(bson, projection=fetched).sort(sort).limit(page_size + 1)
+    self._advise(cursor, bson, sort)
+    documents = list(cursor)
+    if event: hooks.finish(event, documents=len(documents))
+    
+    more = len(documents) > page_size
+    documents = documents[:page_size]
+    
+    next_cursor = None
+    if documents:
+      last = documents[-1]
+      next_cursor = Cursor(fields, [last.get(field) for field in fields])
+    
+    if projection and not keys_only:
+      # the sort fields were only fetched for the resume token, so they
+      # are kept off the partial entities
+      names = set(prop.name() for prop in projection)
+      names.add('_id')
+      documents = [dict((name, value) for name, value in document.items() if name in names) for document in documents]
+    
+    results = [self._hydrate(document, keys_only, projection) for document in documents]
+    if prefetch and not keys_only:
+      self._prefetch(results, prefetch)
+    return results, next_cursor, more
   
-  def count(self):
+  def _resume_bson(self, sort, values):
+    """
+    ' PURPOSE
+    '   Builds the range predicate matching every document that sorts
+    '   after the given sort values. For sort fields (a, b, _id) this is
+    '   a > va OR (a == va AND b > vb) OR (a == va AND b == vb AND _id > vid)
+    '   with the comparisons flipped for descending fields.
+    ' PARAMETERS
+    '   <list tuple(str name, int direction) sort>
+    '   <list object values>
+    ' RETURNS
+    '   <dict bson>
+    ' NOTES
+    '   1. Null and missing values sort before all others, so they are
+    '      handled explicitly since $gt/$lt never match across types.
+    """
+    branches = []
+    for index, (field, direction) in enumerate(sort):
+      value = values[index]
+      equalities = [{ prev_field: values[prev] } for prev, (prev_field, _) in enumerate(sort[:index])]
+      
+      if direction == pymongo.ASCENDING:
+        after = { field: { '$ne': None } } if value is None else { field: { '$gt': value } }
+      else:
+        if value is None: continue
+        after = { '$or': [{ field: { '$lt': value } }, { field: None }] }
+      
+      branches.append({ '$and': equalities + [after] } if equalities else after)
+    
+    if not branches:
+      # nothing can sort after the final position
+      return { '_id': { '$exists': False } }
+    return { '$or': branches }
+  
+  def count(self, limit=None, estimate=False, cache_ttl=None):
     """
     ' PURPOSE
     '   Returns the count of entities matched by this query.
     ' PARAMETERS
-    '   NONE
+    '   optional <int limit> stop counting once this many matches are
+    '                        found. Cheap for checks like 'more than N?'
+    '   optional <bool estimate> use the collection metadata instead of
+    '                            scanning. Only valid without filters.
+    '   optional <float cache_ttl> reuse a count of the same kind, filter
+    '                              and limit for up to this many seconds.
+    '                              see cache.get_count_cache
+    ' RETURNS
+    '   <int count> at most limit when a limit is given
+    """
+    collection = self._model._collection()
+    bson = self._filter()
+    
+    if estimate:
+      if bson:
+        raise ValueError('Estimated counts are only available for unfiltered queries')
+      event = hooks.start('count', self._model)
+      count = collection.estimated_document_count()
+      if event: hooks.finish(event)
+      return count
+    
+    if cache_ttl:
+      cache = get_count_cache()
+      cache_key = (self._model.__name__, _freeze(bson), limit)
+      cached = cache.get(cache_key)
+      if cached is not None:
+        return cached
+    
+    event = hooks.start('count', self._model, bson)
+    if limit:
+      count = collection.count_documents(bson, limit=limit)
+    else:
+      count = collection.count_documents(bson)
+    if event: hooks.finish(event)
+    
+    if cache_ttl:
+      cache.set(cache_key, count, ttl=cache_ttl)
+    return count
+  
+  async def count_async(self, limit=None):
+    """
+    ' PURPOSE
+    '   Awaitable counterpart of count using the async driver.
+    ' PARAMETERS
+    '   optional <int limit> stop counting once this many matches are found
     ' RETURNS
     '   <int count>
     """
-    return self._query.count()
+    collection = self._model._async_collection()
+    bson = self._filter()
+    event = hooks.start('count', self._model, bson)
+    if limit:
+      count = await collection.count_documents(bson, limit=limit)
+    else:
+      count = await collection.count_documents(bson)
+    if event: hooks.finish(event)
+    return count
   
-  def get(self, keys_only=False):
+  def get(self, keys_only=False, projection=None):
     """
     ' PURPOSE
     '   Returns the first model in this query or None if there
     '   isn't one.
     ' PARAMETERS
     '   <bool keys_only>
+    '   optional <list Property projection> only load these properties
     ' RETURNS
     '   <Key key> if keys_only
     '   <Model model> if not keys_only
     """
-    if self.count() == 0:
-      return None
+    names = tuple(prop.name() for prop in projection) if projection else None
+    cache, cache_key, documents = self._cached('fetch', 1, 0, keys_only, names)
+    if documents is None:
+      event = hooks.start('query', self._model, self._filter())
+      documents = list(self._advise(self._query(keys_only, projection).limit(1)))
+      if event: hooks.finish(event, documents=len(documents))
+      if cache: cache.set(cache_key, documents)
     
-    key = Key(self._model, str(self._query[0]['_id']))
-    if keys_only:
-      return key
-    return key.get()
+    if not documents:
+      return None
+    return self._hydrate(documents[0], keys_only, projection)
   
-  def order(self, sort_descriptor):
-    if isinstance(sort_descriptor, Property):
-      sort_descriptor = +sort_descriptor
-    elif not isinstance(sort_descriptor, SortDescriptor):
-      raise InvalidSortDescriptor()
-    # TODO write this method
+  def order(self, *sort_descriptors):
+    """
+    ' PURPOSE
+    '   Returns a new query whose results are sorted server side by
+    '   the given sort descriptors, in order of precedence, after any
+    '   orders already applied to this query.
+    '
+    '   For example. This code sorts users by age ascending and then
+    '   by email descending.
+    '
+    '   -> User.query().order(+User.age, -User.email)
+    '
+    ' PARAMETERS
+    '   <SortDescriptor sort_descriptor1>
+    '   ...
+    '   <SortDescriptor sort_descriptorN>
+    ' RETURNS
+    '   <Query query>
+    ' NOTES
+    '   1. A bare property is treated as an ascending sort.
+    """
+    descriptors = list(self._sort_descriptors)
+    for sort_descriptor in sort_descriptors:
+      if isinstance(sort_descriptor, Property):
+        sort_descriptor = +sort_descriptor
+      elif not isinstance(sort_descriptor, SortDescriptor):
+        raise InvalidSortDescriptor()
+      descriptors.append(sort_descriptor)
+    return Query(self._model, self._logic_chain, descriptors)
+  
+  def group_by(self, *props):
+    """
+    ' PURPOSE
+    '   Groups the entities matched by this query by the values of the
+    '   given properties. Counts, sums, averages and extremes are then
+    '   computed per group on the server.
+    '
+    '   -> Trip.query().group_by(Trip.author).sum(Trip.distance)
+    '
+    ' PARAMETERS
+    '   <Property prop1>
+    '   ...
+    '   <Property propN>
+    ' RETURNS
+    '   <Grouping grouping> see aggregation.Grouping
+    ' NOTES
+    '   1. Any order applied to this query is ignored; order the
+    '      groups instead, see Grouping.aggregate
+    """
+    return Grouping(self, props)
+  
+  def aggregate(self, **accumulators):
+    """
+    ' PURPOSE
+    '   Computes the given accumulators over every entity matched by
+    '   this query, as a single group.
+    '
+    '   -> Trip.query(Trip.author == user).aggregate(trips=db.Count(), longest=db.Max(Trip.distance))
+    '   -> {'trips': 12, 'longest': 42.5}
+    '
+    ' PARAMETERS
+    '   **accumulators <Accumulator> keyed by the name of their value
+    ' RETURNS
+    '   <dict values> None for Avg, Min and Max when nothing matched
+    """
+    rows = Grouping(self, ()).aggregate(**accumulators)
+    if rows:
+      return rows[0]
+    return dict((name, 0 if isinstance(accumulator, (Count, Sum)) else None)
+                for name, accumulator in accumulators.items())
   
   def __iter__(self, *args, **kwargs):
     """
@@ -128,22 +818,216 @@ class Query(object):
     """
     return self.iter(*args, **kwargs)
   
-  def iter(self, keys_only=False):
+  def iter(self, keys_only=False, projection=None, batch_size=100, read_ahead=False, prefetch=None):
+    """
+    ' PURPOSE
+    '   Is a generator that streams all entities matched by this
+    '   query. Documents are read and hydrated batch_size at a time,
+    '   so memory stays bounded however many entities match.
+    ' PARAMETERS
+    '   <bool keys_only>
+    '   optional <list Property projection> only load these properties
+    '   optional <int batch_size> documents per server round trip
+    '   optional <bool read_ahead> read the next batch on a background
+    '                              thread while the current batch is
+    '                              processed. Best for long iterations
+    '                              such as exports.
+    '   optional <list ModelProperty prefetch> resolve these references
+    '                                          once per batch. see
+    '                                          self.fetch
+    ' RETURNS
+    '   <Key key> if keys_only
+    '   <Model model> if not keys_only
+    ' EXAMPLE USAGE
+    '   -> for user in User.query().iter(batch_size=1000, read_ahead=True):
+    '   ->   export(user)
+    """
+    event = hooks.start('query', self._model, self._filter())
+    cursor = self._advise(self._query(keys_only, projection).batch_size(batch_size))
+    batches = _read_ahead(cursor, batch_size) if read_ahead else _batches(cursor, batch_size)
+    batches = _timed(batches, event)
+    try:
+      for batch in batches:
+        results = [self._hydrate(document, keys_only, projection) for document in batch]
+        if prefetch and not keys_only:
+          self._prefetch(results, prefetch)
+        for result in results:
+          yield result
+    finally:
+      batches.close()
+  
+  def _decoders(self, props):
+    """
+    ' PURPOSE
+    '   Returns how to unpack the stored values of the given properties
+    '   of this query's model. see Codec.decode
+    ' PARAMETERS
+    '   <list Property props>
+    ' RETURNS
+    '   <list tuple(str name, type fast, function decoder)>
+    """
+    decoders = self._model._codec._decoders
+    fields = []
+    for prop in props:
+      if not isinstance(prop, Property) or not prop.name() in decoders:
+        raise ValueError('Expected a property of %s. Instead got: %s' % (self._model.__name__, prop))
+      position, fast, decoder = decoders[prop.name()]
+      fields.append((prop.name(), fast, decoder))
+    return fields
+  
+  def values(self, *props, batch_size=100, read_ahead=False):
+    """
+    ' PURPOSE
+    '   Is a generator that streams the values of the given properties
+    '   for every entity matched by this query, in this query's order.
+    '   Only those fields are sent by the server and no Model or Key is
+    '   built, making it much cheaper than iter for reports and exports.
+    '
+    '   -> for email in User.query().values(User.email):
+    '   ->   ...
+    '   -> for email, age in User.query().order(User.age).values(User.email, User.age):
+    '   ->   ...
+    '
+    ' PARAMETERS
+    '   <Property prop1>
+    '   ...
+    '   <Property propN>
+    '   optional <int batch_size> documents per server round trip
+    '   optional <bool read_ahead> see self.iter
+    ' RETURNS
+    '   <object value> unpacked by its property, if given one property
+    '   <tuple values> in the order of the properties, if given many
+    ' NOTES
+    '   1. Missing values are unpacked as if loaded on an entity, ex.
+    '      the property's default.
+    """
+    if not props:
+      raise ValueError('Expected at least one property')
+    fields = self._decoders(props)
+    projection = dict((name, 1) for name, fast, decoder in fields)
+    projection['_id'] = 0
+
+    event = hooks.start('query', self._model, self._filter())
+    cursor = self._model._collection().find(self._filter(), projection=projection)
+    if self._sort_descriptors:
+      cursor = cursor.sort(self._sort())
+    cursor = self._advise(cursor.batch_size(batch_size))
+    batches = _read_ahead(cursor, batch_size) if read_ahead else _batches(cursor, batch_size)
+    batches = _timed(batches, event)
+    try:
+      for batch in batches:
+        if len(fields) == 1:
+          name, fast, decoder = fields[0]
+          for document in batch:
+            value = document.get(name)
+            yield value if value.__class__ is fast else decoder(value)
+        else:
+          for document in batch:
+            row = []
+            for name, fast, decoder in fields:
+              value = document.get(name)
+              row.append(value if value.__class__ is fast else decoder(value))
+            yield tuple(row)
+    finally:
+      batches.close()
+  
+  def distinct(self, prop, batch_size=100):
+    """
+    ' PURPOSE
+    '   Is a generator that streams each distinct value of a property
+    '   among the entities matched by this query. Values are made
+    '   unique on the server and streamed through a cursor, so unlike
+    '   the distinct command there is no limit to their total size.
+    '
+    '   -> tags = set(Post.query(Post.author == user).distinct(Post.tags))
+    '
+    ' PARAMETERS
+    '   <Property prop>
+    '   optional <int batch_size> values per server round trip
+    ' RETURNS
+    '   <object value> unpacked by the property
+    ' NOTES
+    '   1. Each item of a multiple property is a distinct value.
+    '   2. Values are unordered unless this query is ordered by the
+    '      property itself.
+    """
+    name, fast, decoder = self._decoders([prop])[0]
+
+    stages = []
+    bson = self._filter()
+    if bson:
+      stages.append({ '$match': bson })
+    if prop.is_multiple():
+      stages.append({ '$unwind': '$%s' % name })
+    stages.append({ '$group': { '_id': '$%s' % name } })
+    for descriptor in self._sort_descriptors:
+      if descriptor.property.name() == name:
+        stages.append({ '$sort': { '_id': self.SORT_DIRECTIONS[descriptor.direction] } })
+        break
+
+    if prop.is_multiple():
+      # each item is unpacked rather than the whole list
+      decoder = lambda value: None if value is None else prop.unpack(value)
+      fast = _Never
+
+    event = hooks.start('aggregate', self._model, bson)
+    cursor = self._model._collection().aggregate(stages, batchSize=batch_size)
+    batches = _timed(_batches(cursor, batch_size), event)
+    try:
+      for batch in batches:
+        for document in batch:
+          value = document['_id']
+          yield value if value.__class__ is fast else decoder(value)
+    finally:
+      batches.close()
+      cursor.close()
+  
+  def __aiter__(self):
+    """
+    ' PURPOSE
+    '   Allows this class to be used with 'async for' by delegating
+    '   to the iter_async method.
+    ' NOTES
+    '   1. see self.iter_async
+    """
+    return self.iter_async()
+  
+  async def iter_async(self, keys_only=False, projection=None, batch_size=100):
     """
     ' PURPOSE
-    '   Is a generator that iterates over all entities matched by
-    '   this query.
+    '   Is an async generator that iterates over all entities matched
+    '   by this query using the async driver.
     ' PARAMETERS
     '   <bool keys_only>
+    '   optional <list Property projection> only load these properties
+    '   optional <int batch_size> documents per server round trip
     ' RETURNS
     '   <Key key> if keys_only
     '   <Model model> if not keys_only
     """
-    for document in self._query:
-      key = Key(self._model, str(document['_id']))
-      if keys_only:
-        yield key
-      yield key.get()
+    event = hooks.start('query', self._model, self._filter())
+    documents, reading, failed = 0, 0.0, False
+    collection = self._model._async_collection()
+    cursor = self._query(keys_only, projection, collection).batch_size(batch_size)
+    # see _timed
+    try:
+      while True:
+        started = time.perf_counter()
+        try:
+          document = await cursor.__anext__()
+        except StopAsyncIteration:
+          break
+        finally:
+          reading += time.perf_counter() - started
+        documents += 1
+        yield self._hydrate(document, keys_only, projection)
+    except Exception:
+      failed = True
+      raise
+    finally:
+      await cursor.close()
+      if event and not failed:
+        hooks.finish(event, documents=documents, duration=reading)
   
   def __repr__(self):
     """
@@ -160,7 +1044,7 @@ class Query(object):
     ' RETURNS
     '   <str str_value>
     """
-    return '%s(kind=\'%s\', filters=%s)' % (self.__class__.__name__, self._model.__name__, self._logic_chain)
+    return '%s(kind=\'%s\', filters=%s, orders=%s)' % (self.__class__.__name__, self._model.__name__, self._logic_chain, list(self._sort_descriptors))
 
 
 class LogicOperator(object):
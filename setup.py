@@ -28,15 +28,19 @@ setup(
 
     # Specify the Python versions you support here. In particular, ensure
     # that you indicate whether you support Python 2, Python 3 or both.
-    'Programming Language :: Python :: 2',
-    'Programming Language :: Python :: 2.6',
-    'Programming Language :: Python :: 2.7',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.2',
-    'Programming Language :: Python :: 3.3',
-    'Programming Language :: Python :: 3.4',
+    'Programming Language :: Python :: 3 :: Only',
+    'Programming Language :: Python :: 3.7',
+    'Programming Language :: Python :: 3.8',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
+    'Programming Language :: Python :: 3.12',
   ],
   
+  # contextvars (see Context) and re.Pattern require Python 3.7
+  python_requires='>=3.7',
+  
   # What does your project relate to?
   keywords='mongodb tablemongo table mongo db database storage orm',
 
@@ -48,5 +52,12 @@ setup(
   # your project is installed. For an analysis of "install_requires" vs pip's
   # requirements files see:
   # https://packaging.python.org/en/latest/requirements.html
-  install_requires=['pymongo', 'flask']
+  install_requires=['pymongo>=4.0', 'flask'],
+  
+  # the async API (save_async, iter_async, ...) needs AsyncMongoClient,
+  # which first shipped in pymongo 4.9.
+  # ex. pip install TableMongo[async]
+  extras_require={
+    'async': ['pymongo>=4.9']
+  }
 )
\ No newline at end of file
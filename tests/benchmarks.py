@@ -0,0 +1,277 @@
+"""
+' PURPOSE
+'   Benchmarks the hot paths of the ORM: saving, getting, querying,
+'   streaming raw values, hydrating entities, dereferencing
+'   ModelProperty references and packing/unpacking each property type
+'   and whole documents, both generically and with the model's Codec
+'   to show the speedup. For every case it reports operations per
+'   second, datastore round trips per operation (commands sent to the
+'   server, as seen by a pymongo CommandListener) and the peak memory
+'   allocated per operation.
+'
+' USAGE
+'   -> python tests/benchmarks.py                  # local mongod
+'   -> python tests/benchmarks.py --backend mock   # in-process mongomock
+'   -> python tests/benchmarks.py --quick          # fewer operations
+'   -> python tests/benchmarks.py --only fetch     # cases matching 'fetch'
+"""
+import argparse
+import time
+import tracemalloc
+from models import *
+from TableMongo import hooks
+from pymongo import monitoring
+
+
+class Sample(db.Model):
+  _compact = True
+  text = db.StringProperty()
+  integer = db.IntegerProperty()
+  number = db.FloatProperty()
+  flag = db.BooleanProperty()
+  reference = db.KeyProperty()
+  tags = db.StringProperty(multiple=True)
+
+
+class RoundTrips(monitoring.CommandListener):
+  """
+  ' PURPOSE
+  '   Counts the commands sent to the server, including the getMore
+  '   of every further batch of a cursor.
+  '
+  ' NOTES
+  '   1. mongomock never emits command events, so with the mock
+  '      backend it is registered as a post hook instead and counts
+  '      datastore operations, which underestimates streamed reads.
+  """
+
+  def __init__(self):
+    self.count = 0
+
+  def started(self, event):
+    self.count += 1
+
+  def succeeded(self, event):
+    pass
+
+  def failed(self, event):
+    pass
+
+  def __call__(self, event):
+    self.count += 1
+
+
+def measure(name, operation, ops, repeat, round_trips):
+  """
+  ' PURPOSE
+  '   Runs an operation repeat times, keeping the fastest run, then
+  '   runs it once more with tracemalloc enabled to measure memory.
+  ' PARAMETERS
+  '   <str name>
+  '   <function operation> performs ops operations per call
+  '   <int ops>
+  '   <int repeat>
+  '   <RoundTrips round_trips> registered with the client (or hooks)
+  ' RETURNS
+  '   <dict result>
+  """
+  best = None
+  for _ in range(repeat):
+    round_trips.count = 0
+    started = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - started
+    best = elapsed if best is None else min(best, elapsed)
+  trips = round_trips.count
+
+  tracemalloc.start()
+  try:
+    operation()
+    current, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+
+  return {
+    'name': name,
+    'ops_per_sec': ops / best if best else float('inf'),
+    'round_trips': trips / float(ops),
+    'bytes': peak / float(ops)
+  }
+
+
+def report(results):
+  print('%-36s %14s %12s %14s' % ('benchmark', 'ops/sec', 'trips/op', 'peak B/op'))
+  for result in results:
+    print('%-36s %14.1f %12.2f %14.1f' % (
+      result['name'], result['ops_per_sec'], result['round_trips'], result['bytes']))
+
+
+def new_users(count):
+  return [User(email='user%s@doe.com' % i, password='p@ssword') for i in range(count)]
+
+
+def cases(scale):
+  """
+  ' PURPOSE
+  '   Builds the benchmark cases.
+  ' PARAMETERS
+  '   <int scale> the amount of entities used by datastore cases
+  ' RETURNS
+  '   <list tuple(str name, function setup, function operation, int ops)>
+  """
+  def reset():
+    User.delete_all()
+    Trip.delete_all()
+
+  def save():
+    for user in new_users(scale):
+      user.save()
+
+  def put_multi():
+    User.put_multi(new_users(scale))
+
+  state = {}
+
+  def setup_get():
+    reset()
+    state['keys'] = [user.key for user in User.put_multi(new_users(scale))]
+
+  def get():
+    for key in state['keys']:
+      key.get()
+
+  def get_multi():
+    db.Key.get_multi(state['keys'])
+
+  def setup_fetch():
+    reset()
+    User.put_multi(new_users(max(scale, 1000)))
+
+  def fetch(size):
+    return lambda: User.query().fetch(size)
+
+  def setup_trips():
+    reset()
+    users = User.put_multi(new_users(10))
+    Trip.put_multi([Trip(author=users[i % 10], waypoints=[Coordinate(i, i)]) for i in range(scale)])
+
+  def dereference():
+    for trip in Trip.query().fetch():
+      trip.author.email
+
+  built = [
+    ('save (single)', reset, save, scale),
+    ('put_multi (bulk)', reset, put_multi, scale),
+    ('Key.get', setup_get, get, scale),
+    ('Key.get_multi', setup_get, get_multi, scale),
+  ]
+  for size in (10, 100, 1000):
+    built.append(('Query.fetch(%s)' % size, setup_fetch, fetch(size), size))
+  built.append(('Query.iter', setup_fetch, lambda: list(User.query().iter(batch_size=100)), max(scale, 1000)))
+  built.append(('Query.iter (read ahead)', setup_fetch,
+                lambda: list(User.query().iter(batch_size=100, read_ahead=True)), max(scale, 1000)))
+  built.append(('Query.values', setup_fetch, lambda: list(User.query().values(User.email)), max(scale, 1000)))
+  built.append(('fetch + ModelProperty deref', setup_trips, dereference, scale))
+  return built
+
+
+def codec_cases(scale):
+  """
+  ' PURPOSE
+  '   Builds the CPU only cases measuring the pack and unpack cost of
+  '   each property type and of whole entities. Whole documents are
+  '   measured in pairs, generic and Codec, to compare the two paths.
+  ' PARAMETERS
+  '   <int scale> the amount of values packed per case
+  ' RETURNS
+  '   <list tuple(str name, function setup, function operation, int ops)>
+  """
+  key = db.Key(Sample, '5649f0a1e4b0c5b0a1e4b0c5')
+  values = {
+    'text': 'john@doe.com',
+    'integer': 42,
+    'number': 21.75,
+    'flag': True,
+    'reference': key,
+    'tags': ['apples', 'pie', 'cream']
+  }
+
+  built = []
+  for prop in Sample.properties():
+    value = values[prop.name()]
+    packed = prop._pack(value)
+    built.append(('pack %s' % prop, None,
+                  lambda prop=prop, value=value: [prop._pack(value) for _ in range(scale)], scale))
+    built.append(('unpack %s' % prop, None,
+                  lambda prop=prop, packed=packed: [prop._unpack(packed) for _ in range(scale)], scale))
+
+  entity = Sample(**values)
+  document = entity.packed()
+  document['_id'] = key.id
+  size = len(Sample.properties())
+
+  # the whole document path used before Codec, going through every
+  # property's descriptor and _pack/_unpack
+  def generic_encode():
+    json = {}
+    for prop in Sample.properties():
+      json[prop.name()] = prop._pack(getattr(entity, prop.name()))
+    return json
+
+  target = Sample()
+  def generic_decode():
+    for name, value in document.items():
+      if name != '_id':
+        setattr(target, name, getattr(Sample, name)._unpack(value))
+
+  built.append(('encode document (generic)', None, lambda: [generic_encode() for _ in range(scale)], scale))
+  built.append(('encode document (Codec)', None, lambda: [Sample._codec.encode(entity._values) for _ in range(scale)], scale))
+  built.append(('decode document (generic)', None, lambda: [generic_decode() for _ in range(scale)], scale))
+  built.append(('decode document (Codec)', None, lambda: [Sample._codec.decode(document, [None] * size) for _ in range(scale)], scale))
+  built.append(('Model.packed', None, lambda: [entity.packed() for _ in range(scale)], scale))
+  built.append(('Model._from_document', None,
+                lambda: [Sample._from_document(document) for _ in range(scale)], scale))
+  return built
+
+
+def main():
+  parser = argparse.ArgumentParser(description='TableMongo benchmarks')
+  parser.add_argument('--backend', choices=['mongod', 'mock'], default='mongod',
+                      help='run against a local mongod or an in-process mongomock client')
+  parser.add_argument('--uri', default='mongodb://localhost:27017')
+  parser.add_argument('--database', default='tablemongo_benchmarks')
+  parser.add_argument('--quick', action='store_true', help='use fewer operations')
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--only', help='only run cases whose name contains this text')
+  parser.add_argument('--codec-only', action='store_true', help='skip the datastore cases')
+  args = parser.parse_args()
+
+  round_trips = RoundTrips()
+  if args.backend == 'mock':
+    import mongomock
+    db.configure(database=args.database, client=mongomock.MongoClient())
+    hooks.add_post_hook(round_trips)
+  else:
+    db.configure(uri=args.uri, database=args.database, event_listeners=[round_trips])
+
+  scale = 100 if args.quick else 1000
+  selected = codec_cases(scale * 10)
+  if not args.codec_only:
+    selected = cases(scale) + selected
+
+  results = []
+  for name, setup, operation, ops in selected:
+    if args.only and not args.only in name:
+      continue
+    if setup:
+      setup()
+    results.append(measure(name, operation, ops, args.repeat, round_trips))
+  report(results)
+
+  if not args.codec_only:
+    User.delete_all()
+    Trip.delete_all()
+
+
+if __name__ == '__main__':
+  main()
@@ -1,5 +1,17 @@
+import asyncio
+import copy
+import os
+import pickle
 import unittest
+import warnings
 from models import *
+from bson import ObjectId
+from pymongo import MongoClient
+
+try:
+  from pymongo import AsyncMongoClient
+except ImportError:
+  AsyncMongoClient = None
 
 
 class TestCases(unittest.TestCase):
@@ -16,6 +28,17 @@ class TestCases(unittest.TestCase):
     trip_props = Trip.properties().names()
     assert arr_equals(trip_props, ['author', 'waypoints'])
   
+  def test_kind_registry(self):
+    class Admin(User):
+      level = db.IntegerProperty()
+    
+    assert Admin.properties().names() == ('email', 'password', 'level')
+    assert db.Key.get_model('Admin') is Admin
+    assert db.get_kind('User') is User
+    
+    with self.assertRaises(db.DuplicateKindError):
+      type('User', (db.Model,), {})
+  
   def test_property_options(self):
     pass
 
@@ -64,6 +87,30 @@ class TestCases(unittest.TestCase):
     user = User(id=user.key.id)
     assert user.email == 'jack@doe.com'
     assert user.compare_password('lolpass')
+  
+  def test_custom_init(self):
+    class Tracked(db.Model):
+      name = db.StringProperty()
+      
+      def __init__(self, *args, **kwargs):
+        super(Tracked, self).__init__(*args, **kwargs)
+        self.initialized = True
+    
+    Tracked.delete_all()
+    key = Tracked(name='john').save().key
+    
+    # every way of loading an entity runs the model's __init__
+    loaded = [
+      key.get(),
+      Tracked.query().get(),
+      Tracked.query().fetch(1)[0],
+      next(Tracked.query().iter()),
+      Tracked.query().get(projection=[Tracked.name]),
+      db.Key.get_multi([key])[0]
+    ]
+    for entity in loaded:
+      assert entity.initialized
+      assert entity.name == 'john'
 
   def test_querying(self):
     User.delete_all()
@@ -114,6 +161,578 @@ class TestCases(unittest.TestCase):
     
     assert query1.count() == 1
     assert query2.count() == 3
+  
+  def test_batch_operations(self):
+    User.delete_all()
+    
+    users = [User(email='user%s@doe.com' % i, password='p@ssword') for i in range(5)]
+    User.put_multi(users)
+    assert all(user.key for user in users)
+    
+    keys = [user.key for user in users]
+    missing = User.key_from_id('5649f0a1e4b0c5b0a1e4b0c5')
+    fetched = db.Key.get_multi([keys[3], missing, keys[0]])
+    assert fetched[0].email == 'user3@doe.com'
+    assert fetched[1] is None
+    assert fetched[2].email == 'user0@doe.com'
+    
+    users[1].email = 'changed@doe.com'
+    User.put_multi([users[1]])
+    assert users[1].key.get().email == 'changed@doe.com'
+    
+    assert db.Key.delete_multi(keys[:2]) == 2
+    assert User.query().count() == 3
+  
+  def test_filter_optimizer(self):
+    from TableMongo.optimizer import optimize
+    
+    compiled = db.AND(db.AND(User.email > 'a'), User.email < 'k').bson()
+    assert optimize(compiled) == { 'email': { '$gt': 'a', '$lt': 'k' } }
+    assert '$and' in compiled
+    
+    compiled = db.OR(User.email == 'john@doe.com', User.email == 'jane@doe.com').bson()
+    assert optimize(compiled) == { 'email': { '$in': ['john@doe.com', 'jane@doe.com'] } }
+    
+    User.delete_all()
+    User(email='john@doe.com', password='p@ssword').save()
+    User(email='jane@doe.com', password='p@ssword').save()
+    assert User.query(db.OR(User.email == 'john@doe.com', User.email == 'jane@doe.com')).count() == 2
+  
+  def test_ordering(self):
+    User.delete_all()
+    
+    for email in ['b@doe.com', 'c@doe.com', 'a@doe.com']:
+      User(email=email, password='p@ssword').save()
+    
+    query = User.query().order(-User.email)
+    assert [user.email for user in query.fetch()] == ['c@doe.com', 'b@doe.com', 'a@doe.com']
+    
+    query = User.query().order(User.email).filter(User.email != 'a@doe.com')
+    assert [user.email for user in query.fetch(count=1)] == ['b@doe.com']
+  
+  def test_paging(self):
+    User.delete_all()
+    
+    emails = ['user%02d@doe.com' % i for i in range(25)]
+    User.put_multi([User(email=email, password='p@ssword') for email in emails])
+    
+    query = User.query().order(-User.email)
+    fetched, cursor, more = [], None, True
+    while more:
+      page, cursor, more = query.fetch_page(10, start_cursor=cursor)
+      fetched += [user.email for user in page]
+      cursor = db.Cursor(urlsafe=cursor.urlsafe())
+    
+    assert fetched == list(reversed(emails))
+    
+    # the sort fields read for the cursor stay off partial entities
+    page, cursor, more = User.query().order(User.password).fetch_page(10, projection=[User.email])
+    assert more and page[0].email == 'user00@doe.com'
+    self.assertRaises(db.UnprojectedPropertyError, lambda: page[0].password)
+    page, cursor, more = User.query().order(User.password).fetch_page(20, cursor, projection=[User.email])
+    assert [user.email for user in page] == emails[10:]
+  
+  def test_streaming(self):
+    User.delete_all()
+    User.put_multi([User(email='user%s@doe.com' % i, password='p@ssword') for i in range(250)])
+    
+    users = list(User.query().iter(batch_size=50, read_ahead=True))
+    assert len(users) == 250
+    assert len(set(user.key for user in users)) == 250
+    
+    keys = list(User.query().iter(keys_only=True))
+    assert all(isinstance(key, db.Key) for key in keys)
+    
+    events = []
+    db.add_post_hook(events.append)
+    try:
+      for index, user in enumerate(User.query().iter(batch_size=10, read_ahead=True)):
+        if index == 25:
+          break
+    finally:
+      db.remove_hook(events.append)
+    assert [event.operation for event in events] == ['query']
+    assert events[0].documents >= 26
+  
+  def test_counting(self):
+    User.delete_all()
+    User.put_multi([User(email='user%s@doe.com' % i, password='p@ssword') for i in range(5)])
+    
+    assert User.query().count(limit=3) == 3
+    assert User.query(User.email == 'user0@doe.com').count(limit=3) == 1
+    assert User.query().count(estimate=True) == 5
+    with self.assertRaises(ValueError):
+      User.query(User.email == 'user0@doe.com').count(estimate=True)
+    
+    db.clear_caches()
+    query = User.query(db.AND(User.email > 'user0@doe.com', User.password == 'p@ssword'))
+    assert query.count(cache_ttl=60) == 4
+    User(email='user9@doe.com', password='p@ssword').save()
+    # the same filter written in another order reuses the cached count
+    same = User.query(db.AND(User.password == 'p@ssword', User.email > 'user0@doe.com'))
+    assert same.count(cache_ttl=60) == 4
+    assert query.count() == 5
+    db.clear_caches()
+    assert query.count(cache_ttl=60) == 5
+  
+  def test_projection(self):
+    User.delete_all()
+    
+    User(email='john@doe.com', password='p@ssword').save()
+    
+    user = User.query().get(projection=[User.email])
+    assert user.email == 'john@doe.com'
+    assert user.is_partial()
+    self.assertRaises(db.UnprojectedPropertyError, lambda: user.password)
+    self.assertRaises(db.ProjectionError, user.save)
+  
+  def test_context(self):
+    User.delete_all()
+    
+    user = User(email='john@doe.com', password='p@ssword').save()
+    
+    with db.Context() as context:
+      fetched = User.get_by_id(user.key.id)
+      assert User.get_by_id(user.key.id) is fetched
+      assert db.Key.get_multi([user.key])[0] is fetched
+      
+      fetched.email = 'edited@doe.com'
+      assert User.query().fetch()[0] is fetched
+      assert User.get_by_id(user.key.id).email == 'edited@doe.com'
+      
+      fetched.delete()
+      assert not user.key in context
+      assert user.key.get() is None
+    
+    class Flaky(db.Model):
+      name = db.StringProperty()
+      failures = []
+      
+      def __init__(self, *args, **kwargs):
+        if kwargs.get('key') and Flaky.failures:
+          raise Flaky.failures.pop()
+        super(Flaky, self).__init__(*args, **kwargs)
+    
+    key = Flaky(name='john').save().key
+    with db.Context() as context:
+      # a transient failure is raised rather than held as missing
+      Flaky.failures.append(RuntimeError('transient'))
+      self.assertRaises(RuntimeError, key.get)
+      assert not key in context
+      assert key.get().name == 'john'
+      assert db.Key(Flaky, 'invalid').get() is None
+      assert db.Key(Flaky, str(ObjectId())).get() is None
+    
+    def app(environ, start_response):
+      start_response('200 OK', [])
+      for _ in range(2):
+        yield db.get_context() is not None
+    
+    response = db.ContextMiddleware(app)({}, lambda status, headers: None)
+    assert db.get_context() is not None
+    assert list(response) == [True, True]
+    response.close()
+    assert db.get_context() is None
+  
+  def test_global_cache(self):
+    User.delete_all()
+    User._global_cache = True
+    try:
+      user = User(email='john@doe.com', password='p@ssword').save()
+      
+      db.clear_caches()
+      assert user.key.get().email == 'john@doe.com'
+      assert user.key.get().email == 'john@doe.com'
+      assert db.cache_stats()['User']['hits'] >= 1
+      
+      user.delete()
+      assert user.key.get() is None
+      
+      # a get racing the delete must not leave the entity cached
+      user = User(email='jane@doe.com', password='p@ssword').save()
+      racing_get = lambda event: event.operation == 'delete' and user.key.get()
+      db.add_pre_hook(racing_get)
+      try:
+        user.delete()
+      finally:
+        db.remove_hook(racing_get)
+      assert user.key.get() is None
+    finally:
+      User._global_cache = False
+    
+    Profile.delete_all()
+    Profile._global_cache = True
+    try:
+      key = Profile(meta={ 'a': 1 }).save().key
+      db.clear_caches()
+      
+      # unsaved in place changes never reach the cached document
+      key.get().meta['a'] = 99
+      assert key.get().meta == { 'a': 1 }
+      key.get().meta['a'] = 99
+      assert key.get().meta == { 'a': 1 }
+      assert db.Key.get_multi([key])[0].meta == { 'a': 1 }
+    finally:
+      Profile._global_cache = False
+  
+  def test_query_cache(self):
+    User.delete_all()
+    User._query_cache = True
+    try:
+      User(email='john@doe.com', password='p@ssword').save()
+      query = User.query(User.email == 'john@doe.com')
+      assert len(query.fetch()) == 1
+      
+      queries = []
+      hook = db.add_post_hook(lambda event: queries.append(event))
+      try:
+        assert len(query.fetch()) == 1
+        assert queries == []
+        
+        User(email='john@doe.com', password='p@ssword').save()
+        del queries[:]
+        assert len(query.fetch()) == 2
+        assert len(queries) == 1
+      finally:
+        db.remove_hook(hook)
+    finally:
+      User._query_cache = False
+    
+    Profile.delete_all()
+    Profile._query_cache = True
+    try:
+      Profile(meta={ 'a': 1 }).save()
+      # unsaved in place changes never reach the cached results
+      Profile.query().fetch()[0].meta['a'] = 99
+      Profile.query().fetch()[0].meta['a'] = 99
+      assert Profile.query().fetch()[0].meta == { 'a': 1 }
+    finally:
+      Profile._query_cache = False
+  
+  def test_partial_updates(self):
+    User.delete_all()
+    user = User(email='john@doe.com', password='p@ssword').save()
+    assert user.dirty_properties() == []
+    
+    # a concurrent write to another property survives the save
+    other = user.key.get()
+    User._collection().update_one({ '_id': ObjectId(user.key.id) }, { '$set': { 'password': 'changed' } })
+    other.email = 'jane@doe.com'
+    assert other.dirty_properties() == ['email']
+    other.save()
+    
+    document = User._collection().find_one()
+    assert document['email'] == 'jane@doe.com'
+    assert document['password'] == 'changed'
+    
+    # in place changes to mutable values are saved too
+    Profile.delete_all()
+    profile = Profile(meta={ 'a': 1 }, tags=['x']).save()
+    for entity in (profile, profile.key.get()):
+      entity.meta['a'] += 1
+      entity.tags.append('y')
+      assert sorted(entity.dirty_properties()) == ['meta', 'tags']
+      entity.save()
+      assert entity.dirty_properties() == []
+    
+    stored = Profile.query().get()
+    assert stored.meta == { 'a': 3 }
+    assert stored.tags == ['x', 'y', 'y']
+  
+  def test_hooks(self):
+    User.delete_all()
+    
+    pre, post = [], []
+    db.add_pre_hook(pre.append)
+    db.add_post_hook(post.append)
+    try:
+      users = [User(email='user%s@doe.com' % i, password='p@ssword').save() for i in range(5)]
+      users[0].key.get()
+      db.Key.get_multi([user.key for user in users])
+      User.query(User.email == 'user1@doe.com').fetch()
+      stream = User.query().iter(batch_size=2)
+      next(stream)
+      stream.close()
+      users[0].delete()
+    finally:
+      db.remove_hook(pre.append)
+      db.remove_hook(post.append)
+    
+    assert pre == post
+    assert [event.operation for event in post] == ['save'] * 5 + ['get', 'get_multi', 'query', 'query', 'delete']
+    assert all(event.kind == 'User' and event.duration >= 0 for event in post)
+    
+    saves, (get, get_multi, fetch, streamed, delete) = post[:5], post[5:]
+    assert all(event.documents == 1 and event.bytes > 0 for event in saves)
+    assert get.shape() == { '_id': '?' } and get.documents == 1
+    assert get_multi.documents == 5
+    assert 'email' in fetch.shape() and fetch.documents == 1
+    # a stream closed early still reports what it read
+    assert not streamed.filter and streamed.documents == 2
+    assert delete.shape() == { '_id': '?' } and delete.documents == 1
+  
+  @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+  def test_fork(self):
+    User.delete_all()
+    User(email='john@doe.com', password='p@ssword').save()
+    
+    # a child forked while the connection lock is held must not deadlock
+    with db.connection._lock:
+      pid = os.fork()
+      if pid == 0:
+        os._exit(0 if User.query().count() == 1 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+  
+  @unittest.skipUnless(AsyncMongoClient, 'requires the async driver of pymongo 4.9+')
+  def test_async(self):
+    User.delete_all()
+    
+    events = []
+    db.add_post_hook(events.append)
+    
+    async def run():
+      user = await User(email='john@doe.com', password='a').save_async()
+      assert user.key and isinstance(user.key.id, str)
+      
+      user.password = 'b'
+      await user.save_async()
+      await user.save_async()
+      
+      fetched = await user.key.get_async()
+      assert fetched.password == 'b'
+      
+      users = await User.query(User.email == 'john@doe.com').fetch_async()
+      assert [found.key for found in users] == [user.key]
+    
+    try:
+      asyncio.run(run())
+    finally:
+      db.remove_hook(events.append)
+    # the unchanged save sends nothing
+    assert [event.operation for event in events].count('save') == 2
+  
+  @unittest.skipUnless(AsyncMongoClient, 'requires the async driver of pymongo 4.9+')
+  def test_async_client_injection(self):
+    User.delete_all()
+    User.put_multi([User(email='%d@doe.com' % i, password='a') for i in range(3)])
+    
+    async def run():
+      client = AsyncMongoClient()
+      db.configure(async_client=client)
+      try:
+        # leaving early closes the cursor
+        async for user in User.query().iter_async(batch_size=1):
+          break
+        assert await User.query().count_async() == 3
+      finally:
+        db.configure()
+        await client.close()
+    
+    asyncio.run(run())
+    
+    # an injected sync client is not silently paired with the default uri
+    client = MongoClient()
+    db.configure(client=client)
+    try:
+      with self.assertRaises(RuntimeError):
+        db.connection.get_async_client()
+    finally:
+      db.configure()
+      client.close()
+  
+  def test_codec(self):
+    class EmailProperty(db.StringProperty):
+      def _checktype(self, value):
+        if not '@' in value:
+          raise db.BadValueError('Invalid email: %s' % value)
+        return super(EmailProperty, self)._checktype(value)
+    
+    class Contact(db.Model):
+      name = db.StringProperty()
+      email = EmailProperty()
+    
+    # the fast path is only taken by unchanged built in properties
+    encoders = dict((encoder[0], encoder[2]) for encoder in Contact._codec._encoders)
+    assert encoders['name'] is str
+    assert encoders['email'] is not str
+    
+    contact = Contact(name='john', email='john@doe.com')
+    assert contact.packed() == { 'name': 'john', 'email': 'john@doe.com' }
+    contact.email = 'invalid'
+    self.assertRaises(db.BadValueError, contact.packed)
+    
+    values = [None, None]
+    Contact._codec.decode({ '_id': ObjectId(), 'name': 'john', 'tags': [] }, values)
+    assert values[Contact.name._position] == 'john' and values[Contact.email._position] is None
+  
+  def test_compact_entities(self):
+    user = User(email='john@doe.com', password='p@ssword')
+    user.nickname = 'john'
+    assert user.nickname == 'john'
+    
+    class Compact(db.Model):
+      _compact = True
+      name = db.StringProperty()
+    
+    class CompactChild(Compact):
+      age = db.IntegerProperty()
+    
+    for entity in (Compact(name='john'), CompactChild(name='john', age=3)):
+      assert not hasattr(entity, '__dict__')
+      with self.assertRaises(AttributeError):
+        entity.nickname = 'john'
+    
+    compact = Compact(name='john')
+    clone = copy.copy(compact)
+    clone.name = 'jane'
+    assert compact.name == 'john'
+  
+  def test_references(self):
+    User.delete_all()
+    Trip.delete_all()
+    user = User(email='john@doe.com', password='p@ssword').save()
+    Trip.put_multi([Trip(author=user) for _ in range(3)])
+    
+    trip = Trip.query().get()
+    assert not trip.author.is_resolved()
+    assert isinstance(trip.author, User)
+    assert trip.author.key == user.key
+    assert trip.author != user and trip.author == Trip.query().get().author
+    assert len(set([trip.author, Trip.query().get().author])) == 1
+    assert trip.author.email == 'john@doe.com'
+    
+    trips = Trip.query().fetch(prefetch=[Trip.author])
+    assert all(trip.author.is_resolved() for trip in trips)
+    
+    # a fetched reference can be saved like the entity it stands for
+    author = Trip.query().get().author
+    author.password = 'changed'
+    assert [saved.key for saved in User.put_multi([author])] == [user.key]
+    assert user.key.get().password == 'changed'
+    assert not User.ingest([author])['inserted']
+    
+    trip = Trip.query().get()
+    for clone in [copy.deepcopy(trip), pickle.loads(pickle.dumps(trip))]:
+      assert clone.key == trip.key
+      assert isinstance(clone.author, User)
+      assert clone.author.key == user.key
+      assert clone.author.email == 'john@doe.com'
+    
+    user.delete()
+    with self.assertRaises(db.DanglingReferenceError):
+      Trip.query().get().author.email
+  
+  def test_ingest(self):
+    User.delete_all()
+    users = ({ 'email': 'user%s@doe.com' % i, 'password': 'p@ssword' } for i in range(25))
+    report = User.ingest(users, batch_size=10)
+    assert report['inserted'] == 25
+    assert report['errors'] == []
+    assert User.query().count() == 25
+    
+    john = User(email='john@doe.com', password='p@ssword')
+    inserted = []
+    report = User.ingest([john, { 'email': 'jane@doe.com' }], on_insert=lambda index, key: inserted.append((index, key)))
+    assert report['inserted'] == 1
+    assert report['errors'][0][0] == 1
+    assert john.key.get().email == 'john@doe.com'
+    assert inserted == [(0, john.key)] and isinstance(inserted[0][1].id, str)
+    
+    class Unencodable(db.Property):
+      def pack(self, value):
+        return object()
+    
+    class Opaque(db.Model):
+      data = Unencodable()
+    
+    Opaque.delete_all()
+    inserted = []
+    report = Opaque.ingest([{}, { 'data': 'x' }, {}], on_insert=lambda index, key: inserted.append(index))
+    assert report['inserted'] == 2
+    assert [index for index, error in report['errors']] == [1]
+    assert inserted == [0, 2]
+  
+  def test_aggregation(self):
+    User.delete_all()
+    Trip.delete_all()
+    john = User(email='john@doe.com', password='p@ssword').save()
+    jane = User(email='jane@doe.com', password='p@ssword').save()
+    Trip.put_multi([Trip(author=john) for _ in range(3)] + [Trip(author=jane)])
+    
+    counts = Trip.query().group_by(Trip.author).count()
+    assert dict((author.key, count) for author, count in counts.items()) == { john.key: 3, jane.key: 1 }
+    
+    rows = Trip.query().group_by(Trip.author).aggregate(trips=db.Count(), order='-trips', limit=1)
+    assert len(rows) == 1 and rows[0]['trips'] == 3
+    assert rows[0]['author'].email == 'john@doe.com'
+    
+    assert Trip.query(Trip.author == jane).aggregate(trips=db.Count()) == { 'trips': 1 }
+    assert User.query().group_by(User.email).aggregate(n=db.Count(), order=[+User.email])[0]['email'] == 'jane@doe.com'
+    
+    class Reading(db.Model):
+      value = db.IntegerProperty()
+    
+    Reading.delete_all()
+    Reading.put_multi([Reading(value=value) for value in (1, 1, 2)])
+    assert Reading.query().group_by(Reading.value).count() == { 1: 2, 2: 1 }
+    assert Reading.query().group_by(Reading.value).sum(Reading.value) == { 1: 2, 2: 2 }
+  
+  def test_values(self):
+    User.delete_all()
+    User.put_multi([User(email='user%s@doe.com' % i, password='p@ssword') for i in range(3)])
+    User(email='user0@doe.com', password='other').save()
+    
+    emails = list(User.query().order(-User.email).values(User.email))
+    assert emails == ['user2@doe.com', 'user1@doe.com', 'user0@doe.com', 'user0@doe.com']
+    
+    rows = list(User.query(User.password == 'other').values(User.email, User.password))
+    assert rows == [('user0@doe.com', 'other')]
+    
+    assert sorted(User.query().distinct(User.email)) == ['user0@doe.com', 'user1@doe.com', 'user2@doe.com']
+    assert list(User.query().order(User.email).distinct(User.email))[0] == 'user0@doe.com'
+  
+  def test_indexes(self):
+    class Indexed(db.Model):
+      email = db.StringProperty(unique=True)
+      age = db.IntegerProperty()
+      _indexes = [(age, -email)]
+    
+    Indexed.delete_all()
+    
+    report = db.ensure_indexes([Indexed])['Indexed']
+    assert sorted(report['created']) == ['age_1_email_-1', 'email_1']
+    
+    report = db.ensure_indexes([Indexed])['Indexed']
+    assert report['created'] == [] and len(report['unchanged']) == 2
+  
+  def test_index_advisor(self):
+    class Advised(db.Model):
+      name = db.StringProperty()
+      age = db.IntegerProperty()
+    
+    Advised.delete_all()
+    Advised.put_multi([Advised(name='john', age=age) for age in range(5)])
+    query = Advised.query(Advised.name == 'john').order(Advised.age)
+    
+    summary = query.explain()
+    assert summary['winning_plan'].get('stage')
+    assert summary['collection_scan'] and not summary['used_index']
+    assert summary['suggested_index'] == [('name', 1), ('age', 1)]
+    
+    db.enable_index_advisor()
+    try:
+      with self.assertWarns(db.IndexAdvisorWarning):
+        assert len(query.fetch()) == 5
+      
+      Advised._collection().create_index([('name', 1), ('age', 1)])
+      with warnings.catch_warnings():
+        warnings.simplefilter('error', db.IndexAdvisorWarning)
+        assert len(query.fetch()) == 5
+      assert query.explain()['used_index']
+    finally:
+      db.enable_index_advisor(False)
+      Advised._collection().drop_indexes()
     
     
 
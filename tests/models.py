@@ -11,7 +11,7 @@ class User(db.Model):
 
   def hash_password(self, password):
     from hashlib import sha256
-    return sha256(password).hexdigest()
+    return sha256(password.encode('utf-8')).hexdigest()
 
   def set_password(self, password):
     self.password = self.hash_password(password)
@@ -44,4 +44,22 @@ class CoordinateProperty(db.Property):
 
 class Trip(db.Model):
   waypoints = CoordinateProperty(multiple=True, default=[])
-  author = db.ModelProperty(User, required=True)
\ No newline at end of file
+  author = db.ModelProperty(User, required=True)
+
+
+class MetaProperty(db.Property):
+  
+  @staticmethod
+  def type():
+    return dict
+
+  def pack(self, value):
+    return value
+
+  def unpack(self, value):
+    return value
+
+
+class Profile(db.Model):
+  meta = MetaProperty()
+  tags = db.StringProperty(multiple=True)